@@ -2,14 +2,17 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from fastapi import Depends, HTTPException, Query, Security, status
+from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 import os
 
 from database import get_db
 from models import User
+from services.api_keys import api_key_index, last_used_tracker
+from services.ttl_cache import TTLCache
 
 load_dotenv()
 
@@ -17,8 +20,32 @@ SECRET_KEY = os.getenv("SECRET_KEY", "6c7b86ee6fd271f62a20cd07346f2622a736f8472d
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "10080"))
 
+# Resolved users are cached by token subject so most requests skip the user query
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+user_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+
+
+@event.listens_for(User, "after_update")
+def _invalidate_updated_user(mapper, connection, target):
+    """Drop a cached user when its email or password changes"""
+    state = inspect(target)
+    if not (state.attrs.email.history.has_changes() or state.attrs.hashed_password.history.has_changes()):
+        return
+    user_cache.invalidate(target.email)
+    for old_email in state.attrs.email.history.deleted:
+        user_cache.invalidate(old_email)
+
+
+@event.listens_for(User, "after_delete")
+def _invalidate_deleted_user(mapper, connection, target):
+    """Drop a cached user when it is deleted"""
+    user_cache.invalidate(target.email)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -56,12 +83,7 @@ def decode_token(token: str) -> dict:
         )
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get the current authenticated user from JWT token"""
-    token = credentials.credentials
+async def _user_from_token(token: str, db: AsyncSession) -> User:
     payload = decode_token(token)
     
     email: str = payload.get("sub")
@@ -72,7 +94,11 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = db.query(User).filter(User.email == email).first()
+    user = user_cache.get(email)
+    if user is not None:
+        return user
+    
+    user = await db.scalar(select(User).where(User.email == email))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -80,4 +106,94 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Detach so the cached instance is never tied to this request's session
+    db.expunge(user)
+    user_cache.set(email, user)
+    
     return user
+
+
+async def _user_from_api_key(key: str, db: AsyncSession) -> User:
+    match = await api_key_index.lookup(key, db)
+    user = await db.get(User, match[1]) if match else None
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key",
+            headers={"WWW-Authenticate": "ApiKey"},
+        )
+    
+    # Recorded in memory and written in batches by a background job
+    last_used_tracker.touch(match[0])
+    
+    return user
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """
+    Get the current authenticated user from JWT token
+    
+    Users are served from user_cache when possible. ORM updates and deletes
+    of a user invalidate its entry in this process; other workers pick the
+    change up within AUTH_CACHE_TTL_SECONDS.
+    """
+    return await _user_from_token(credentials.credentials, db)
+
+
+async def get_api_key_user(
+    api_key: Optional[str] = Security(api_key_header),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """Get the user owning the API key in the X-API-Key header"""
+    if not api_key:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing API key",
+            headers={"WWW-Authenticate": "ApiKey"},
+        )
+    
+    return await _user_from_api_key(api_key, db)
+
+
+async def get_current_user_or_api_key(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    api_key: Optional[str] = Security(api_key_header),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """Accept either a JWT bearer token or an X-API-Key header"""
+    if api_key:
+        return await _user_from_api_key(api_key, db)
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    return await _user_from_token(credentials.credentials, db)
+
+
+async def get_stream_user(
+    token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """
+    Accept a JWT bearer token or a ?token= query parameter
+
+    Browsers cannot set headers on an EventSource, so streaming endpoints
+    also take the token from the query string.
+    """
+    if credentials is not None:
+        return await _user_from_token(credentials.credentials, db)
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    return await _user_from_token(token, db)
@@ -0,0 +1,31 @@
+"""
+Script to rebuild the health check rollup tables from raw health checks.
+Run this once after upgrading so history recorded before rollups existed is
+included in the metrics endpoints. Re-running it is safe: only buckets
+from each provider's oldest remaining raw health check onwards are rebuilt,
+so rollups of days already removed by retention are kept.
+"""
+from database import SessionLocal, engine, Base
+from services.rollups import rebuild_rollups
+
+# Create tables if they don't exist
+Base.metadata.create_all(bind=engine)
+
+
+def backfill_rollups():
+    """Recompute every minute, hour and day bucket that raw health checks still cover"""
+    db = SessionLocal()
+    
+    try:
+        total = rebuild_rollups(db)
+        print(f"\n✅ Rolled up {total} health checks")
+    except Exception as e:
+        print(f"Error rebuilding rollups: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=== Backfill Health Check Rollups ===\n")
+    backfill_rollups()
@@ -0,0 +1,257 @@
+"""
+Benchmark: health check scheduling with a large number of providers.
+
+Runs the check scheduler on a virtual clock, without a server, a database
+or any network calls. It reports the cost of the due-time queue operations and
+of the provider add/update/remove events, then simulates an hour of
+dispatching with adaptive intervals, once with the heap and once with a
+dispatcher that scans every provider on a fixed tick. The scan has to look
+at every provider on each tick and checks each one up to a tick late.
+
+Finally it dispatches several due groups at once through the scheduler, as
+its run() loop does, with a stand-in probe that records how many probes are
+in flight per host, and checks that the sweeper's limits hold across groups.
+
+Usage:
+    python benchmark_scheduler.py
+"""
+import asyncio
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+
+from services import health_checker
+from services.check_scheduler import DueQueue, ProviderCheckScheduler
+from services.write_buffer import HealthCheckWriteBuffer
+
+PROVIDER_COUNT = int(os.getenv("BENCHMARK_PROVIDERS", "100000"))
+# Virtual time to simulate, and the tick of the scanning dispatcher
+SIMULATED_SECONDS = float(os.getenv("BENCHMARK_SECONDS", "3600"))
+SCAN_TICK_SECONDS = float(os.getenv("BENCHMARK_SCAN_TICK_SECONDS", "5"))
+# Share of probes that come back offline
+FAILURE_RATE = float(os.getenv("BENCHMARK_FAILURE_RATE", "0.01"))
+EVENTS = int(os.getenv("BENCHMARK_EVENTS", "10000"))
+# Groups dispatched at once, providers per group, and hosts they share
+CONCURRENCY_GROUPS = int(os.getenv("BENCHMARK_CONCURRENCY_GROUPS", "10"))
+CONCURRENCY_GROUP_SIZE = int(os.getenv("BENCHMARK_CONCURRENCY_GROUP_SIZE", "20"))
+CONCURRENCY_HOSTS = int(os.getenv("BENCHMARK_CONCURRENCY_HOSTS", "3"))
+PROBE_SECONDS = float(os.getenv("BENCHMARK_PROBE_SECONDS", "0.01"))
+
+
+def fake_rows(count: int) -> list:
+    """(provider, status) rows; a tenth of the providers have never been checked"""
+    rows = []
+    for provider_id in range(1, count + 1):
+        provider = SimpleNamespace(
+            id=provider_id,
+            name=f"Provider {provider_id}",
+            url=f"https://node-{provider_id}.example.com",
+            probe_method=None,
+            chain_family=None
+        )
+        provider_status = None
+        if provider_id % 10:
+            provider_status = SimpleNamespace(
+                consecutive_failures=0,
+                recent_outcomes="1" * random.randint(1, 100)
+            )
+        rows.append((provider, provider_status))
+    return rows
+
+
+def timed(label: str, operations: int, fn):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<34} {elapsed * 1000:9.1f}ms  {elapsed / max(1, operations) * 1e6:7.2f}us/op")
+    return result
+
+
+def bench_queue(count: int):
+    queue = DueQueue()
+    dues = [random.uniform(0, 3600) for _ in range(count)]
+
+    def schedule_all():
+        for provider_id, due in enumerate(dues):
+            queue.schedule(provider_id, due)
+
+    def reschedule_all():
+        for provider_id in range(count):
+            queue.schedule(provider_id, random.uniform(0, 3600))
+
+    def peek_many():
+        for _ in range(count):
+            queue.peek()
+
+    timed("schedule", count, schedule_all)
+    timed("reschedule (leaves stale entries)", count, reschedule_all)
+    timed("peek", count, peek_many)
+    timed("pop all due", count, lambda: queue.pop_due(float("inf")))
+
+
+def simulate_heap(rows: list) -> dict:
+    """Dispatch on a virtual clock, jumping straight to each next due time"""
+    scheduler = ProviderCheckScheduler()
+    scheduler.load(rows, now=0.0)
+    now, checks, wakeups, lateness = 0.0, 0, 0, 0.0
+    while True:
+        next_due = scheduler.queue.peek()
+        if next_due is None or next_due > SIMULATED_SECONDS:
+            break
+        now = max(now, next_due)
+        wakeups += 1
+        due = scheduler.take_due(now, 500)
+        results = {
+            scheduled.id: {"status": "offline" if random.random() < FAILURE_RATE else "online"}
+            for scheduled in due
+        }
+        scheduler.reschedule(due, results, now)
+        checks += len(due)
+    return {"checks": checks, "wakeups": wakeups, "lateness": lateness}
+
+
+def simulate_scan(rows: list) -> dict:
+    """The same hour with a dispatcher that looks at every provider on each tick"""
+    scheduler = ProviderCheckScheduler()
+    scheduler.load(rows, now=0.0)
+    due_at = {provider_id: scheduler.queue.due_at(provider_id) for provider_id in scheduler._providers}
+    now, checks, wakeups, lateness = 0.0, 0, 0, 0.0
+    while now <= SIMULATED_SECONDS:
+        wakeups += 1
+        due = [provider_id for provider_id, due in due_at.items() if due <= now]
+        for provider_id in due:
+            lateness += now - due_at[provider_id]
+            scheduled = scheduler._providers[provider_id]
+            scheduled.record(random.random() >= FAILURE_RATE)
+            due_at[provider_id] = now + scheduled.interval()
+        checks += len(due)
+        now += SCAN_TICK_SECONDS
+    return {"checks": checks, "wakeups": wakeups, "lateness": lateness}
+
+
+def print_simulation(name: str, stats: dict, seconds: float, visited: int):
+    checks = max(1, stats["checks"])
+    print(
+        f"{name:<18} {stats['checks']:>8} checks  {stats['wakeups']:>6} wakeups  "
+        f"{visited / checks:8.1f} providers visited/check  "
+        f"{stats['lateness'] / checks:5.2f}s avg past due  {seconds:6.2f}s CPU"
+    )
+
+
+def bench_events(rows: list):
+    scheduler = ProviderCheckScheduler()
+    scheduler.load(rows, now=0.0)
+    ids = random.sample(range(1, len(rows) + 1), min(EVENTS, len(rows)))
+
+    def updates():
+        for provider_id in ids:
+            provider = rows[provider_id - 1][0]
+            provider.url = provider.url + "/v2"
+            scheduler.provider_updated(provider)
+
+    def removes():
+        for provider_id in ids:
+            scheduler.provider_removed(provider_id)
+
+    def adds():
+        for provider_id in ids:
+            scheduler.provider_added(rows[provider_id - 1][0])
+
+    timed("provider_updated (URL change)", len(ids), updates)
+    timed("provider_removed", len(ids), removes)
+    timed("provider_added", len(ids), adds)
+
+
+async def measure_concurrency() -> dict:
+    """Peak probes in flight, per host and overall, while groups run side by side"""
+    in_flight, peaks = Counter(), Counter()
+
+    async def probe(url, client=None, method=None):
+        host = health_checker._host_of(url)
+        in_flight[host] += 1
+        in_flight["*"] += 1
+        peaks[host] = max(peaks[host], in_flight[host])
+        peaks["*"] = max(peaks["*"], in_flight["*"])
+        try:
+            await asyncio.sleep(PROBE_SECONDS)
+        finally:
+            in_flight[host] -= 1
+            in_flight["*"] -= 1
+        return {"status": "online", "response_time_ms": PROBE_SECONDS * 1000,
+                "error_message": None, "checked_at": datetime.utcnow()}
+
+    # Results stay in a buffer that never flushes, so no database is needed
+    scheduler = ProviderCheckScheduler(buffer=HealthCheckWriteBuffer(max_size=10 ** 9, max_age_seconds=float("inf")))
+    count = CONCURRENCY_GROUPS * CONCURRENCY_GROUP_SIZE
+    rows = [
+        (SimpleNamespace(
+            id=provider_id,
+            name=f"Provider {provider_id}",
+            url=f"https://node-{provider_id % CONCURRENCY_HOSTS}.example.com/{provider_id}",
+            probe_method="eth_blockNumber",
+            chain_family="evm"
+        ), None)
+        for provider_id in range(1, count + 1)
+    ]
+    scheduler.load(rows, now=0.0)
+    due = scheduler.take_due(float("inf"))
+    groups = [due[i:i + CONCURRENCY_GROUP_SIZE] for i in range(0, len(due), CONCURRENCY_GROUP_SIZE)]
+
+    real_probe = health_checker.probe_provider
+    health_checker.probe_provider = probe
+    try:
+        # Each group is its own task, as in ProviderCheckScheduler.run()
+        await asyncio.gather(*(scheduler._check(group) for group in groups))
+    finally:
+        health_checker.probe_provider = real_probe
+
+    return {
+        "groups": len(groups),
+        "per_host": max(peak for host, peak in peaks.items() if host != "*"),
+        "overall": peaks["*"],
+        "max_per_host": health_checker.MAX_CHECKS_PER_HOST,
+        "max_concurrency": health_checker.MAX_CONCURRENT_CHECKS
+    }
+
+
+def main():
+    random.seed(1)
+    print(f"{PROVIDER_COUNT} providers\n")
+
+    print("Due-time queue")
+    bench_queue(PROVIDER_COUNT)
+
+    rows = fake_rows(PROVIDER_COUNT)
+    print(f"\nEvents ({EVENTS} each)")
+    bench_events(rows)
+
+    rows = fake_rows(PROVIDER_COUNT)
+    print(f"\nDispatching {SIMULATED_SECONDS:.0f}s of virtual time")
+    started = time.perf_counter()
+    heap = simulate_heap(rows)
+    print_simulation("Heap dispatcher", heap, time.perf_counter() - started, heap["checks"])
+
+    rows = fake_rows(PROVIDER_COUNT)
+    started = time.perf_counter()
+    scan = simulate_scan(rows)
+    print_simulation(
+        "Scan every " + format(SCAN_TICK_SECONDS, "g") + "s", scan,
+        time.perf_counter() - started, scan["wakeups"] * PROVIDER_COUNT
+    )
+
+    print("\nConcurrency across dispatched groups")
+    peaks = asyncio.run(measure_concurrency())
+    print(
+        f"{peaks['groups']} groups: peak {peaks['per_host']} probes per host "
+        f"(limit {peaks['max_per_host']}), {peaks['overall']} overall (limit {peaks['max_concurrency']})"
+    )
+    assert peaks["per_host"] <= peaks["max_per_host"], "per-host limit not shared across groups"
+    assert peaks["overall"] <= peaks["max_concurrency"], "global limit not shared across groups"
+
+
+if __name__ == "__main__":
+    print("=== RPC Sentinel Scheduler Benchmark ===\n")
+    main()
@@ -0,0 +1,137 @@
+"""
+Load test: dashboard request latency while health checks are running.
+
+Measures p50/p95/p99 latency of the dashboard read endpoints against a
+running server, first on its own and then while every provider is being
+health checked over and over. With database I/O off the event loop the two
+phases should report similar p99s.
+
+Usage:
+    uvicorn main:app --port 8000
+    python load_test.py
+"""
+import asyncio
+import os
+import statistics
+import time
+import httpx
+
+BASE_URL = os.getenv("LOAD_TEST_URL", "http://localhost:8000")
+EMAIL = os.getenv("LOAD_TEST_EMAIL", "loadtest@example.com")
+PASSWORD = os.getenv("LOAD_TEST_PASSWORD", "loadtest-password")
+# Providers to create for the test, and the RPC endpoint they point at
+PROVIDER_COUNT = int(os.getenv("LOAD_TEST_PROVIDERS", "50"))
+PROVIDER_URL = os.getenv("LOAD_TEST_PROVIDER_URL", "https://node.primordial.bdagscan.com")
+CONCURRENCY = int(os.getenv("LOAD_TEST_CONCURRENCY", "20"))
+PHASE_SECONDS = float(os.getenv("LOAD_TEST_SECONDS", "15"))
+
+READ_ENDPOINTS = ["/api/providers", "/api/metrics/realtime", "/api/alerts"]
+
+
+async def get_token(client: httpx.AsyncClient) -> str:
+    """Register the load test user if needed and log in"""
+    credentials = {"email": EMAIL, "password": PASSWORD}
+    await client.post("/api/auth/register", json=credentials)
+    response = await client.post("/api/auth/login", json=credentials)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def ensure_providers(client: httpx.AsyncClient) -> list:
+    """Create providers until the user has PROVIDER_COUNT of them"""
+    providers = (await client.get("/api/providers")).json()
+    for i in range(len(providers), PROVIDER_COUNT):
+        response = await client.post("/api/providers", json={
+            "name": f"Load Test {i}",
+            "url": PROVIDER_URL,
+            "description": "Created by load_test.py"
+        })
+        response.raise_for_status()
+        providers.append(response.json())
+    return [provider["id"] for provider in providers]
+
+
+async def read_worker(client: httpx.AsyncClient, deadline: float, latencies: list, errors: list):
+    i = 0
+    while time.perf_counter() < deadline:
+        endpoint = READ_ENDPOINTS[i % len(READ_ENDPOINTS)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            response = await client.get(endpoint)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(str(e))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def check_worker(client: httpx.AsyncClient, provider_ids: list, deadline: float) -> int:
+    """Keep every provider under health check until the deadline"""
+    checks = 0
+    while time.perf_counter() < deadline:
+        await asyncio.gather(
+            *(client.post(f"/api/providers/{provider_id}/check") for provider_id in provider_ids),
+            return_exceptions=True
+        )
+        checks += len(provider_ids)
+    return checks
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_phase(client: httpx.AsyncClient, provider_ids: list, with_checks: bool) -> dict:
+    latencies, errors = [], []
+    deadline = time.perf_counter() + PHASE_SECONDS
+    readers = [read_worker(client, deadline, latencies, errors) for _ in range(CONCURRENCY)]
+    if with_checks:
+        checks, *_ = await asyncio.gather(check_worker(client, provider_ids, deadline), *readers)
+    else:
+        checks = 0
+        await asyncio.gather(*readers)
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "checks": checks,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": percentile(latencies, 95) if latencies else 0.0,
+        "p99": percentile(latencies, 99) if latencies else 0.0
+    }
+
+
+def print_phase(name: str, stats: dict):
+    print(
+        f"{name:<16} {stats['requests']:>6} requests  {stats['errors']:>4} errors  "
+        f"p50 {stats['p50']:7.1f}ms  p95 {stats['p95']:7.1f}ms  p99 {stats['p99']:7.1f}ms"
+        + (f"  ({stats['checks']} health checks)" if stats["checks"] else "")
+    )
+
+
+async def main():
+    limits = httpx.Limits(max_connections=CONCURRENCY + PROVIDER_COUNT)
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=60.0, limits=limits) as client:
+        token = await get_token(client)
+        client.headers["Authorization"] = f"Bearer {token}"
+        provider_ids = await ensure_providers(client)
+
+        print(f"{len(provider_ids)} providers, {CONCURRENCY} concurrent readers, {PHASE_SECONDS:.0f}s per phase\n")
+        idle = await run_phase(client, provider_ids, with_checks=False)
+        print_phase("Idle", idle)
+        busy = await run_phase(client, provider_ids, with_checks=True)
+        print_phase("During checks", busy)
+
+        if idle["p99"]:
+            print(f"\np99 ratio (during checks / idle): {busy['p99'] / idle['p99']:.2f}x")
+
+
+if __name__ == "__main__":
+    print("=== RPC Sentinel Load Test ===\n")
+    try:
+        asyncio.run(main())
+    except httpx.ConnectError:
+        print(f"❌ Backend is not running or not accessible at {BASE_URL}!")
+        exit(1)
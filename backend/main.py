@@ -4,9 +4,11 @@ from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 
-from database import engine, Base
-from routers import auth, providers, api_keys, metrics
+from database import engine, async_engine, Base
+from migrations import run_migrations
+from routers import auth, providers, api_keys, metrics, rpc, events
 from services.background_tasks import start_background_tasks, stop_background_tasks
+from services.http_client import start_http_client, close_http_client
 
 load_dotenv()
 
@@ -23,6 +25,12 @@ async def lifespan(app: FastAPI):
     Base.metadata.create_all(bind=engine)
     print("Database tables created")
     
+    # Bring existing tables up to date
+    run_migrations()
+    
+    # Shared outbound HTTP client for provider probes and the RPC proxy
+    start_http_client()
+    
     # Start background tasks
     start_background_tasks()
     
@@ -30,7 +38,9 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     print("Shutting down RPC Sentinel Backend...")
-    stop_background_tasks()
+    await stop_background_tasks()
+    await close_http_client()
+    await async_engine.dispose()
 
 
 app = FastAPI(
@@ -58,6 +68,8 @@ app.include_router(auth.router)
 app.include_router(providers.router)
 app.include_router(api_keys.router)
 app.include_router(metrics.router)
+app.include_router(rpc.router)
+app.include_router(events.router)
 
 
 @app.get("/")
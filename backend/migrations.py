@@ -0,0 +1,152 @@
+"""
+Versioned schema migrations.
+
+Base.metadata.create_all creates missing tables but never changes tables
+that already exist. Anything that alters an existing table (new indexes,
+columns or data fixes) is added here as a numbered migration, and
+run_migrations() applies the pending ones in order on startup.
+Each migration runs in its own transaction and is recorded in the
+schema_migrations table so it is only ever applied once.
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, insert, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from database import engine
+from models import Provider, ProviderStatus, HealthCheck, HealthCheckRollup, Alert, ApiKey
+from services.api_keys import KEY_PREFIX_LENGTH, hash_api_key
+from services.provider_status import rebuild_provider_status
+
+migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _create_index(conn: Connection, table, name: str):
+    """Create one of a model's declared indexes if it does not exist yet"""
+    index = next(index for index in table.indexes if index.name == name)
+    index.create(conn, checkfirst=True)
+
+
+def _add_column(conn: Connection, table, name: str):
+    """Add one of a model's declared columns to an existing table if it is missing"""
+    if name in {column["name"] for column in inspect(conn).get_columns(table.name)}:
+        return
+    column = table.c[name]
+    ddl = f"ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(dialect=conn.dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT '{column.server_default.arg}'"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    conn.execute(text(ddl))
+
+
+def _add_hot_path_indexes(conn: Connection):
+    _create_index(conn, HealthCheck.__table__, "ix_health_checks_provider_checked_at")
+    _create_index(conn, HealthCheck.__table__, "ix_health_checks_checked_at")
+    _create_index(conn, Alert.__table__, "ix_alerts_open_provider_severity")
+    _create_index(conn, HealthCheckRollup.__table__, "ix_health_check_rollups_granularity_bucket")
+
+
+def _add_alert_listing_indexes(conn: Connection):
+    _create_index(conn, Provider.__table__, "ix_providers_user_id")
+    _create_index(conn, Alert.__table__, "ix_alerts_created_at_id")
+    _create_index(conn, Alert.__table__, "ix_alerts_provider_created_at_id")
+
+
+def _populate_provider_status(conn: Connection):
+    with Session(bind=conn) as db:
+        rebuild_provider_status(db)
+
+
+def _hash_api_keys(conn: Connection):
+    """Replace plaintext keys with their SHA-256 digest and keep a display prefix"""
+    _add_column(conn, ApiKey.__table__, "key_prefix")
+    table = ApiKey.__table__
+    rows = conn.execute(select(table.c.id, table.c.key).where(table.c.key_prefix.is_(None))).all()
+    for key_id, key in rows:
+        conn.execute(update(table).where(table.c.id == key_id).values(
+            key=hash_api_key(key),
+            key_prefix=key[:KEY_PREFIX_LENGTH]
+        ))
+
+
+def _add_provider_groups(conn: Connection):
+    _add_column(conn, Provider.__table__, "group_name")
+    _create_index(conn, Provider.__table__, "ix_providers_user_group")
+
+
+def _add_provider_capabilities(conn: Connection):
+    _add_column(conn, Provider.__table__, "probe_method")
+    _add_column(conn, Provider.__table__, "chain_family")
+
+
+def _add_change_tracking(conn: Connection):
+    _add_column(conn, Provider.__table__, "updated_at")
+    _create_index(conn, ProviderStatus.__table__, "ix_provider_status_last_checked_at")
+    _create_index(conn, Alert.__table__, "ix_alerts_resolved_at")
+
+
+def _add_api_key_change_tracking(conn: Connection):
+    _add_column(conn, ApiKey.__table__, "updated_at")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Index health checks by provider and time, open alerts and rollup buckets", _add_hot_path_indexes),
+    (2, "Populate provider_status from recorded health checks", _populate_provider_status),
+    (3, "Index providers by user and alerts for keyset pagination", _add_alert_listing_indexes),
+    (4, "Store API keys as SHA-256 digests with a display prefix", _hash_api_keys),
+    (5, "Add proxy groups to providers", _add_provider_groups),
+    (6, "Remember each provider's probe method and chain family", _add_provider_capabilities),
+    (7, "Track provider edits and index recent changes for the event relay", _add_change_tracking),
+    (8, "Track API key edits so every worker's key index sees revocations", _add_api_key_change_tracking),
+]
+
+
+def _is_applied(bind: Engine, version: int) -> bool:
+    with bind.connect() as conn:
+        return conn.scalar(
+            select(schema_migrations.c.version).where(schema_migrations.c.version == version)
+        ) is not None
+
+
+def run_migrations(bind: Engine = engine) -> List[int]:
+    """
+    Apply every migration that has not been applied yet
+
+    Returns the versions applied by this call.
+    """
+    migration_metadata.create_all(bind=bind)
+
+    with bind.connect() as conn:
+        applied = set(conn.scalars(select(schema_migrations.c.version)))
+
+    newly_applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            with bind.begin() as conn:
+                migrate(conn)
+                conn.execute(insert(schema_migrations).values(
+                    version=version,
+                    description=description,
+                    applied_at=datetime.utcnow()
+                ))
+        except Exception:
+            # Another worker starting at the same time may have won the race
+            if _is_applied(bind, version):
+                continue
+            raise
+        newly_applied.append(version)
+        print(f"Applied migration {version}: {description}")
+
+    return newly_applied
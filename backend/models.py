@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -19,22 +19,41 @@ class User(Base):
 
 class Provider(Base):
     __tablename__ = "providers"
+    __table_args__ = (
+        # Providers behind one /rpc/{group} route
+        Index("ix_providers_user_group", "user_id", "group_name"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     name = Column(String, nullable=False)
     url = Column(String, nullable=False)
     description = Column(Text, nullable=True)
+    # Proxy group the provider serves traffic for
+    group_name = Column(String, nullable=False, default="default", server_default="default")
+    # Probe method found to work for this endpoint, and the chain family it implies
+    probe_method = Column(String, nullable=True)
+    chain_family = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Lets probe workers in other processes notice edits
+    updated_at = Column(DateTime, nullable=True, onupdate=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="providers")
     health_checks = relationship("HealthCheck", back_populates="provider", cascade="all, delete-orphan")
     alerts = relationship("Alert", back_populates="provider", cascade="all, delete-orphan")
+    rollups = relationship("HealthCheckRollup", back_populates="provider", cascade="all, delete-orphan")
+    status = relationship("ProviderStatus", back_populates="provider", uselist=False, cascade="all, delete-orphan")
 
 
 class HealthCheck(Base):
     __tablename__ = "health_checks"
+    __table_args__ = (
+        # Latest check / checks in a time range for one provider
+        Index("ix_health_checks_provider_checked_at", "provider_id", "checked_at"),
+        # Time-range scans across providers (retention)
+        Index("ix_health_checks_checked_at", "checked_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     provider_id = Column(Integer, ForeignKey("providers.id"), nullable=False)
@@ -47,8 +66,78 @@ class HealthCheck(Base):
     provider = relationship("Provider", back_populates="health_checks")
 
 
+class ProviderStatus(Base):
+    __tablename__ = "provider_status"
+    __table_args__ = (
+        # Providers checked recently (event relay)
+        Index("ix_provider_status_last_checked_at", "last_checked_at"),
+    )
+
+    provider_id = Column(Integer, ForeignKey("providers.id"), primary_key=True)
+    last_status = Column(String, nullable=False)  # "online" or "offline"
+    last_response_time_ms = Column(Float, nullable=True)
+    last_error = Column(Text, nullable=True)
+    last_checked_at = Column(DateTime, nullable=False)
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+    recent_outcomes = Column(String, nullable=False, default="")  # "1" online / "0" offline, oldest first
+    recent_online = Column(Integer, nullable=False, default=0)
+    
+    # Relationships
+    provider = relationship("Provider", back_populates="status")
+
+    @property
+    def uptime(self):
+        if not self.recent_outcomes:
+            return 100.0
+        return (self.recent_online / len(self.recent_outcomes)) * 100
+
+
+class HealthCheckRollup(Base):
+    __tablename__ = "health_check_rollups"
+    __table_args__ = (
+        UniqueConstraint("provider_id", "granularity", "bucket_start", name="uq_health_check_rollups_bucket"),
+        # Buckets of one granularity across providers (metrics windows, retention)
+        Index("ix_health_check_rollups_granularity_bucket", "granularity", "bucket_start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider_id = Column(Integer, ForeignKey("providers.id"), nullable=False)
+    granularity = Column(String, nullable=False)  # "minute", "hour" or "day"
+    bucket_start = Column(DateTime, nullable=False)
+    check_count = Column(Integer, nullable=False, default=0)
+    online_count = Column(Integer, nullable=False, default=0)
+    latency_count = Column(Integer, nullable=False, default=0)
+    latency_sum = Column(Float, nullable=False, default=0.0)
+    latency_min = Column(Float, nullable=True)
+    latency_max = Column(Float, nullable=True)
+    latency_p95 = Column(Float, nullable=True)
+    latency_histogram = Column(Text, nullable=True)  # JSON counts per latency bucket
+    
+    # Relationships
+    provider = relationship("Provider", back_populates="rollups")
+
+    @property
+    def latency_avg(self):
+        if not self.latency_count:
+            return None
+        return self.latency_sum / self.latency_count
+
+
 class Alert(Base):
     __tablename__ = "alerts"
+    __table_args__ = (
+        # Open alerts per provider, as looked up on every health check write
+        Index(
+            "ix_alerts_open_provider_severity", "provider_id", "severity",
+            sqlite_where=text("resolved = 0"),
+            postgresql_where=text("resolved = false")
+        ),
+        # Newest-first alert pages, overall and per provider
+        Index("ix_alerts_created_at_id", "created_at", "id"),
+        Index("ix_alerts_provider_created_at_id", "provider_id", "created_at", "id"),
+        # Recently resolved alerts (event relay)
+        Index("ix_alerts_resolved_at", "resolved_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     provider_id = Column(Integer, ForeignKey("providers.id"), nullable=False)
@@ -67,11 +156,27 @@ class ApiKey(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # SHA-256 hex digest of the key; the plaintext is only returned once, on creation
     key = Column(String, unique=True, index=True, nullable=False)
+    key_prefix = Column(String, nullable=True)
     name = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_used = Column(DateTime, nullable=True)
     is_active = Column(Boolean, default=True)
+    # Set when a key is revoked or otherwise edited, so every worker's key index notices
+    updated_at = Column(DateTime, nullable=True, onupdate=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="api_keys")
+
+
+class WorkerLease(Base):
+    __tablename__ = "worker_leases"
+
+    # One row per live background worker, renewed by its heartbeat
+    worker_id = Column(String, primary_key=True)
+    hostname = Column(String, nullable=False)
+    pid = Column(Integer, nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,46 @@
+"""
+Standalone health check worker.
+
+Runs the health check scheduler, write buffer, worker coordination,
+retention and database maintenance without serving HTTP, so probing is
+kept off the API server's event loop and can be scaled on its own. Results
+reach the API through the database. Run the API with background tasks
+disabled and any number of these against the same database:
+
+Usage:
+    RUN_BACKGROUND_TASKS=false uvicorn main:app --port 8000
+    python probe_worker.py
+"""
+import asyncio
+import signal
+
+from database import engine, async_engine, Base
+from migrations import run_migrations
+from services.background_tasks import start_background_tasks, stop_background_tasks
+from services.http_client import start_http_client, close_http_client
+
+
+async def main():
+    print("Starting RPC Sentinel probe worker...")
+
+    # Whichever process starts first brings the schema up to date
+    Base.metadata.create_all(bind=engine)
+    run_migrations()
+
+    start_http_client()
+    start_background_tasks(health_checks=True)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    await stopping.wait()
+
+    print("Shutting down RPC Sentinel probe worker...")
+    await stop_background_tasks()
+    await close_http_client()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
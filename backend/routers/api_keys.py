@@ -1,13 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
-import secrets
 
 from database import get_db
 from models import User, ApiKey
 from auth import get_current_user
+from services.api_keys import KEY_PREFIX_LENGTH, api_key_index, generate_api_key, hash_api_key, mask_api_key
 
 router = APIRouter(prefix="/api/keys", tags=["API Keys"])
 
@@ -20,6 +21,7 @@ class ApiKeyResponse(BaseModel):
     id: int
     name: str
     key: str
+    key_prefix: Optional[str] = None
     created_at: datetime
     last_used: Optional[datetime] = None
     is_active: bool
@@ -28,52 +30,68 @@ class ApiKeyResponse(BaseModel):
         from_attributes = True
 
 
+def _api_key_response(api_key: ApiKey, key: Optional[str] = None) -> dict:
+    """Only the create response carries the full key; listings get a masked one"""
+    return {
+        "id": api_key.id,
+        "name": api_key.name,
+        "key": key or mask_api_key(api_key.key_prefix),
+        "key_prefix": api_key.key_prefix,
+        "created_at": api_key.created_at,
+        "last_used": api_key.last_used,
+        "is_active": api_key.is_active
+    }
+
+
 @router.get("", response_model=List[ApiKeyResponse])
 async def list_api_keys(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """List all API keys for the current user"""
-    api_keys = db.query(ApiKey).filter(
+    api_keys = (await db.scalars(select(ApiKey).where(
         ApiKey.user_id == current_user.id,
         ApiKey.is_active == True
-    ).all()
+    ))).all()
     
-    return api_keys
+    return [_api_key_response(api_key) for api_key in api_keys]
 
 
 @router.post("", response_model=ApiKeyResponse, status_code=status.HTTP_201_CREATED)
 async def create_api_key(
     key_data: ApiKeyCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-
-    key = f"rpc_{secrets.token_urlsafe(32)}"
+    """Create an API key; the full key is only returned in this response"""
+    key = generate_api_key()
     
     new_key = ApiKey(
         user_id=current_user.id,
-        key=key,
+        key=hash_api_key(key),
+        key_prefix=key[:KEY_PREFIX_LENGTH],
         name=key_data.name
     )
     db.add(new_key)
-    db.commit()
-    db.refresh(new_key)
+    await db.commit()
+    await db.refresh(new_key)
+    
+    api_key_index.add(new_key.key_prefix, new_key.key, new_key.id, new_key.user_id)
     
-    return new_key
+    return _api_key_response(new_key, key)
 
 
 @router.delete("/{key_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_api_key(
     key_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete (deactivate) an API key"""
-    api_key = db.query(ApiKey).filter(
+    api_key = await db.scalar(select(ApiKey).where(
         ApiKey.id == key_id,
         ApiKey.user_id == current_user.id
-    ).first()
+    ))
     
     if not api_key:
         raise HTTPException(
@@ -83,6 +101,7 @@ async def delete_api_key(
     
     # Soft delete by marking as inactive
     api_key.is_active = False
-    db.commit()
+    await db.commit()
+    api_key_index.remove(api_key.key_prefix, api_key.id)
     
     return None
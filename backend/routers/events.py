@@ -0,0 +1,95 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from datetime import datetime
+import json
+import os
+from dotenv import load_dotenv
+
+from database import AsyncSessionLocal
+from models import User, Provider, ProviderStatus
+from auth import get_stream_user
+from services.event_hub import event_hub
+
+load_dotenv()
+
+# A comment line is sent when nothing else was for this long, to keep proxies from closing the stream
+EVENT_STREAM_KEEPALIVE_SECONDS = float(os.getenv("EVENT_STREAM_KEEPALIVE_SECONDS", "15"))
+
+router = APIRouter(prefix="/api/events", tags=["Events"])
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+
+
+async def _snapshot(user_id: int) -> dict:
+    """Current state of every provider, in the same shape as provider_status events"""
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(Provider, ProviderStatus).outerjoin(
+                ProviderStatus, ProviderStatus.provider_id == Provider.id
+            ).where(Provider.user_id == user_id)
+        )).all()
+
+    providers = []
+    for provider, provider_status in rows:
+        providers.append({
+            "provider_id": provider.id,
+            "provider_name": provider.name,
+            "status": provider_status.last_status if provider_status else "unknown",
+            "response_time_ms": provider_status.last_response_time_ms if provider_status else None,
+            "error_message": provider_status.last_error if provider_status else None,
+            "last_checked": provider_status.last_checked_at if provider_status else provider.created_at,
+            "consecutive_failures": provider_status.consecutive_failures if provider_status else 0,
+            "uptime": provider_status.uptime if provider_status else 100.0
+        })
+    return {"providers": providers}
+
+
+@router.get("/stream")
+async def stream_events(current_user: User = Depends(get_stream_user)):
+    """
+    Server-Sent Events stream of provider status and alert changes
+
+    The first event is a "snapshot" with the current state of every
+    provider. After that only changes are sent, as they are written:
+    - provider_status: latest state of a provider that was just checked
+    - alert_opened / alert_resolved
+    - provider_created / provider_updated / provider_deleted
+
+    A client that falls too far behind gets a "resync" event and the stream
+    ends; EventSource reconnects on its own and starts from a new snapshot.
+    Takes the JWT as a ?token= query parameter since EventSource cannot send
+    headers.
+    """
+    user_id = current_user.id
+
+    async def events():
+        # Subscribe before reading the snapshot so no change falls in between
+        subscription = event_hub.subscribe(user_id)
+        try:
+            yield format_event("snapshot", await _snapshot(user_id))
+            while True:
+                item = await subscription.get(timeout=EVENT_STREAM_KEEPALIVE_SECONDS)
+                if subscription.overflowed:
+                    yield format_event("resync", {})
+                    return
+                if item is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(*item)
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
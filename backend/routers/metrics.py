@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import and_, desc, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timedelta
+import base64
 
 from database import get_db
-from models import User, Provider, HealthCheck, Alert
-from auth import get_current_user
+from models import User, Provider, ProviderStatus, HealthCheckRollup, Alert
+from auth import get_current_user_or_api_key, user_cache
+from services.archive import health_check_stats
+from services.rpc_cache import rpc_response_cache
+from services.rpc_proxy import rpc_proxy, rpc_single_flight
 
 router = APIRouter(prefix="/api", tags=["Metrics"])
 
@@ -24,6 +28,26 @@ class UsageDataPoint(BaseModel):
     provider: str
 
 
+class LatencySummary(BaseModel):
+    min: float
+    avg: float
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+
+class ProviderHistoryStats(BaseModel):
+    provider_id: int
+    provider_name: str
+    checks: int
+    online_checks: int
+    uptime: Optional[float]
+    latency_ms: Optional[LatencySummary]
+    archived_checks: int
+    live_checks: int
+
+
 class AlertResponse(BaseModel):
     id: int
     provider_name: str
@@ -45,42 +69,37 @@ class RealtimeMetric(BaseModel):
 
 @router.get("/metrics/uptime", response_model=List[UptimeDataPoint])
 async def get_uptime_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    days: int = Query(7, ge=1, le=365),
+    current_user: User = Depends(get_current_user_or_api_key),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get uptime statistics for the last 7 days"""
-    providers = db.query(Provider).filter(Provider.user_id == current_user.id).all()
+    """Get daily uptime statistics for the last `days` days"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    window_start = today - timedelta(days=days - 1)
+    
+    # Uptime per provider per day comes from the day rollups, averaged across providers
+    rows = (await db.execute(
+        select(
+            HealthCheckRollup.bucket_start,
+            func.avg(HealthCheckRollup.online_count * 100.0 / HealthCheckRollup.check_count)
+        ).join(
+            Provider, Provider.id == HealthCheckRollup.provider_id
+        ).where(
+            Provider.user_id == current_user.id,
+            HealthCheckRollup.granularity == "day",
+            HealthCheckRollup.bucket_start >= window_start,
+            HealthCheckRollup.check_count > 0
+        ).group_by(HealthCheckRollup.bucket_start)
+    )).all()
+    uptime_by_day = {bucket.strftime("%Y-%m-%d"): uptime for bucket, uptime in rows}
     
     result = []
-    for i in range(7):
-        date = datetime.utcnow() - timedelta(days=6-i)
-        day_name = date.strftime("%a")
-        
-        # Calculate average uptime for all providers on this day
-        total_uptime = 0
-        provider_count = 0
-        
-        for provider in providers:
-            # Get checks for this day
-            start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_of_day = start_of_day + timedelta(days=1)
-            
-            checks = db.query(HealthCheck).filter(
-                HealthCheck.provider_id == provider.id,
-                HealthCheck.checked_at >= start_of_day,
-                HealthCheck.checked_at < end_of_day
-            ).all()
-            
-            if checks:
-                online_count = sum(1 for check in checks if check.status == "online")
-                uptime = (online_count / len(checks)) * 100
-                total_uptime += uptime
-                provider_count += 1
-        
-        avg_uptime = total_uptime / provider_count if provider_count > 0 else 100.0
+    for i in range(days):
+        date = window_start + timedelta(days=i)
+        avg_uptime = uptime_by_day.get(date.strftime("%Y-%m-%d"), 100.0)
         
         result.append({
-            "name": day_name,
+            "name": date.strftime("%a"),
             "uptime": round(avg_uptime, 2),
             "date": date.strftime("%Y-%m-%d")
         })
@@ -90,85 +109,173 @@ async def get_uptime_stats(
 
 @router.get("/metrics/usage", response_model=List[UsageDataPoint])
 async def get_usage_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    days: int = Query(7, ge=1, le=365),
+    current_user: User = Depends(get_current_user_or_api_key),
+    db: AsyncSession = Depends(get_db)
 ):
     """Get API usage statistics"""
-    # For now, return mock data based on health checks
-    providers = db.query(Provider).filter(Provider.user_id == current_user.id).all()
+    # For now, usage is the number of health checks per provider per day
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    window_start = today - timedelta(days=days - 1)
     
-    result = []
-    for i in range(7):
-        date = datetime.utcnow() - timedelta(days=6-i)
-        
-        for provider in providers:
-            start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_of_day = start_of_day + timedelta(days=1)
-            
-            check_count = db.query(func.count(HealthCheck.id)).filter(
-                HealthCheck.provider_id == provider.id,
-                HealthCheck.checked_at >= start_of_day,
-                HealthCheck.checked_at < end_of_day
-            ).scalar()
-            
-            if check_count > 0:
-                result.append({
-                    "date": date.strftime("%Y-%m-%d"),
-                    "requests": check_count,
-                    "provider": provider.name
-                })
+    rows = (await db.execute(
+        select(
+            HealthCheckRollup.bucket_start,
+            HealthCheckRollup.check_count,
+            Provider.name
+        ).join(
+            Provider, Provider.id == HealthCheckRollup.provider_id
+        ).where(
+            Provider.user_id == current_user.id,
+            HealthCheckRollup.granularity == "day",
+            HealthCheckRollup.bucket_start >= window_start,
+            HealthCheckRollup.check_count > 0
+        ).order_by(HealthCheckRollup.bucket_start, Provider.id)
+    )).all()
     
-    return result
+    return [
+        {
+            "date": bucket.strftime("%Y-%m-%d"),
+            "requests": check_count,
+            "provider": name
+        }
+        for bucket, check_count, name in rows
+    ]
+
+
+@router.get("/metrics/latency", response_model=List[ProviderHistoryStats])
+async def get_latency_stats(
+    days: int = Query(90, ge=1, le=3650),
+    provider_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user_or_api_key),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get uptime and latency percentiles per provider for the last `days` days
+    
+    Days whose raw checks retention moved to the columnar archive are read
+    from it in one scan for all providers; the rest come from the day rollups.
+    """
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    window_start = today - timedelta(days=days - 1)
+    
+    query = select(Provider.id, Provider.name).where(Provider.user_id == current_user.id)
+    if provider_id is not None:
+        query = query.where(Provider.id == provider_id)
+    providers = (await db.execute(query.order_by(Provider.id))).all()
+    
+    if provider_id is not None and not providers:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Provider not found"
+        )
+    
+    stats = await health_check_stats(db, [pid for pid, _ in providers], window_start, datetime.utcnow())
+    
+    return [
+        {"provider_id": pid, "provider_name": name, **stats[pid]}
+        for pid, name in providers
+    ]
+
+
+def _encode_cursor(created_at: datetime, alert_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{alert_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, alert_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(alert_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
 
 
 @router.get("/alerts", response_model=List[AlertResponse])
 async def get_alerts(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    resolved: Optional[bool] = None,
+    severity: Optional[str] = None,
+    provider_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user_or_api_key),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get all alerts for user's providers"""
-    providers = db.query(Provider).filter(Provider.user_id == current_user.id).all()
-    provider_ids = [p.id for p in providers]
+    """
+    Get alerts for user's providers, newest first
     
-    alerts = db.query(Alert).filter(
-        Alert.provider_id.in_(provider_ids)
-    ).order_by(desc(Alert.created_at)).limit(50).all()
+    Pages are keyed on (created_at, id). When more alerts remain, the
+    X-Next-Cursor response header holds the cursor for the next page.
+    """
+    query = select(
+        Alert.id,
+        Provider.name,
+        Alert.severity,
+        Alert.message,
+        Alert.created_at,
+        Alert.resolved
+    ).join(
+        Provider, Provider.id == Alert.provider_id
+    ).where(Provider.user_id == current_user.id)
     
-    result = []
-    for alert in alerts:
-        provider = db.query(Provider).filter(Provider.id == alert.provider_id).first()
-        result.append({
-            "id": alert.id,
-            "provider_name": provider.name if provider else "Unknown",
-            "severity": alert.severity,
-            "message": alert.message,
-            "created_at": alert.created_at,
-            "resolved": alert.resolved
-        })
+    if resolved is not None:
+        query = query.where(Alert.resolved == resolved)
+    if severity is not None:
+        query = query.where(Alert.severity == severity)
+    if provider_id is not None:
+        query = query.where(Alert.provider_id == provider_id)
+    if cursor:
+        cursor_created_at, cursor_id = _decode_cursor(cursor)
+        query = query.where(or_(
+            Alert.created_at < cursor_created_at,
+            and_(Alert.created_at == cursor_created_at, Alert.id < cursor_id)
+        ))
     
-    return result
+    rows = (await db.execute(
+        query.order_by(desc(Alert.created_at), desc(Alert.id)).limit(limit + 1)
+    )).all()
+    
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    
+    return [
+        {
+            "id": alert_id,
+            "provider_name": provider_name,
+            "severity": alert_severity,
+            "message": message,
+            "created_at": created_at,
+            "resolved": alert_resolved
+        }
+        for alert_id, provider_name, alert_severity, message, created_at, alert_resolved in rows
+    ]
 
 
 @router.get("/metrics/realtime", response_model=List[RealtimeMetric])
 async def get_realtime_metrics(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_or_api_key),
+    db: AsyncSession = Depends(get_db)
 ):
     """Get real-time metrics for all providers"""
-    providers = db.query(Provider).filter(Provider.user_id == current_user.id).all()
+    rows = (await db.execute(
+        select(Provider, ProviderStatus).outerjoin(
+            ProviderStatus, ProviderStatus.provider_id == Provider.id
+        ).where(Provider.user_id == current_user.id)
+    )).all()
     
     result = []
-    for provider in providers:
-        latest_check = db.query(HealthCheck).filter(
-            HealthCheck.provider_id == provider.id
-        ).order_by(desc(HealthCheck.checked_at)).first()
-        
-        if latest_check:
+    for provider, provider_status in rows:
+        if provider_status:
             result.append({
                 "provider_name": provider.name,
-                "status": latest_check.status,
-                "response_time_ms": latest_check.response_time_ms,
-                "last_checked": latest_check.checked_at
+                "status": provider_status.last_status,
+                "response_time_ms": provider_status.last_response_time_ms,
+                "last_checked": provider_status.last_checked_at
             })
         else:
             result.append({
@@ -179,3 +286,16 @@ async def get_realtime_metrics(
             })
     
     return result
+
+
+@router.get("/metrics/cache")
+async def get_cache_metrics(
+    current_user: User = Depends(get_current_user_or_api_key)
+):
+    """Get hit/miss counters for the in-process caches of this worker"""
+    return {
+        "auth": user_cache.stats(),
+        "rpc_routes": rpc_proxy.routes.stats(),
+        "rpc_responses": rpc_response_cache.stats(),
+        "rpc_single_flight": rpc_single_flight.stats()
+    }
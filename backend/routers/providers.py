@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 
 from database import get_db
-from models import User, Provider, HealthCheck
-from auth import get_current_user
+from models import User, Provider, ProviderStatus
+from auth import get_current_user, get_current_user_or_api_key
+from services.capabilities import provider_capabilities
+from services.check_scheduler import check_scheduler
+from services.event_hub import event_hub
+from services.export import EXPORT_FORMATS, export_health_checks
+from services.rpc_proxy import rpc_proxy
 
 router = APIRouter(prefix="/api/providers", tags=["Providers"])
 
@@ -16,12 +22,14 @@ class ProviderCreate(BaseModel):
     name: str
     url: str
     description: Optional[str] = None
+    group_name: str = "default"
 
 
 class ProviderUpdate(BaseModel):
     name: Optional[str] = None
     url: Optional[str] = None
     description: Optional[str] = None
+    group_name: Optional[str] = None
 
 
 class HealthCheckResponse(BaseModel):
@@ -38,6 +46,9 @@ class ProviderResponse(BaseModel):
     name: str
     url: str
     description: Optional[str]
+    group_name: str = "default"
+    chain_family: Optional[str] = None
+    probe_method: Optional[str] = None
     created_at: datetime
     latest_health: Optional[HealthCheckResponse] = None
     uptime: float = 100.0
@@ -46,115 +57,99 @@ class ProviderResponse(BaseModel):
         from_attributes = True
 
 
+def _provider_response(provider: Provider, provider_status: Optional[ProviderStatus]) -> dict:
+    latest_health = None
+    if provider_status is not None:
+        latest_health = {
+            "status": provider_status.last_status,
+            "response_time_ms": provider_status.last_response_time_ms,
+            "checked_at": provider_status.last_checked_at
+        }
+    return {
+        "id": provider.id,
+        "name": provider.name,
+        "url": provider.url,
+        "description": provider.description,
+        "group_name": provider.group_name,
+        "chain_family": provider.chain_family,
+        "probe_method": provider.probe_method,
+        "created_at": provider.created_at,
+        "latest_health": latest_health,
+        "uptime": provider_status.uptime if provider_status is not None else 100.0
+    }
+
+
+async def _get_user_provider(db: AsyncSession, provider_id: int, user: User):
+    """Load a provider and its current status, or raise 404"""
+    row = (await db.execute(
+        select(Provider, ProviderStatus).outerjoin(
+            ProviderStatus, ProviderStatus.provider_id == Provider.id
+        ).where(
+            Provider.id == provider_id,
+            Provider.user_id == user.id
+        )
+    )).first()
+    
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Provider not found"
+        )
+    
+    return row
+
+
 @router.get("", response_model=List[ProviderResponse])
 async def list_providers(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_or_api_key),
+    db: AsyncSession = Depends(get_db)
 ):
     """List all providers for the current user"""
-    providers = db.query(Provider).filter(Provider.user_id == current_user.id).all()
-    
-    result = []
-    for provider in providers:
-        # Get latest health check
-        latest_health = db.query(HealthCheck).filter(
-            HealthCheck.provider_id == provider.id
-        ).order_by(desc(HealthCheck.checked_at)).first()
-        
-        # Calculate uptime (last 100 checks)
-        recent_checks = db.query(HealthCheck).filter(
-            HealthCheck.provider_id == provider.id
-        ).order_by(desc(HealthCheck.checked_at)).limit(100).all()
-        
-        uptime = 100.0
-        if recent_checks:
-            online_count = sum(1 for check in recent_checks if check.status == "online")
-            uptime = (online_count / len(recent_checks)) * 100
-        
-        provider_data = {
-            "id": provider.id,
-            "name": provider.name,
-            "url": provider.url,
-            "description": provider.description,
-            "created_at": provider.created_at,
-            "latest_health": latest_health,
-            "uptime": uptime
-        }
-        result.append(provider_data)
+    rows = (await db.execute(
+        select(Provider, ProviderStatus).outerjoin(
+            ProviderStatus, ProviderStatus.provider_id == Provider.id
+        ).where(Provider.user_id == current_user.id)
+    )).all()
     
-    return result
+    return [_provider_response(provider, provider_status) for provider, provider_status in rows]
 
 
 @router.post("", response_model=ProviderResponse, status_code=status.HTTP_201_CREATED)
 async def create_provider(
     provider_data: ProviderCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new provider"""
     new_provider = Provider(
         user_id=current_user.id,
         name=provider_data.name,
         url=provider_data.url,
-        description=provider_data.description
+        description=provider_data.description,
+        group_name=provider_data.group_name
     )
     db.add(new_provider)
-    db.commit()
-    db.refresh(new_provider)
+    await db.commit()
+    await db.refresh(new_provider)
+    rpc_proxy.invalidate_routes(current_user.id, new_provider.group_name)
+    check_scheduler.provider_added(new_provider)
     
-    return {
-        "id": new_provider.id,
-        "name": new_provider.name,
-        "url": new_provider.url,
-        "description": new_provider.description,
-        "created_at": new_provider.created_at,
-        "latest_health": None,
-        "uptime": 100.0
-    }
+    response = _provider_response(new_provider, None)
+    event_hub.publish(current_user.id, "provider_created", response)
+    
+    return response
 
 
 @router.get("/{provider_id}", response_model=ProviderResponse)
 async def get_provider(
     provider_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_or_api_key),
+    db: AsyncSession = Depends(get_db)
 ):
     """Get a specific provider"""
-    provider = db.query(Provider).filter(
-        Provider.id == provider_id,
-        Provider.user_id == current_user.id
-    ).first()
+    provider, provider_status = await _get_user_provider(db, provider_id, current_user)
     
-    if not provider:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Provider not found"
-        )
-    
-    # Get latest health check
-    latest_health = db.query(HealthCheck).filter(
-        HealthCheck.provider_id == provider.id
-    ).order_by(desc(HealthCheck.checked_at)).first()
-    
-    # Calculate uptime
-    recent_checks = db.query(HealthCheck).filter(
-        HealthCheck.provider_id == provider.id
-    ).order_by(desc(HealthCheck.checked_at)).limit(100).all()
-    
-    uptime = 100.0
-    if recent_checks:
-        online_count = sum(1 for check in recent_checks if check.status == "online")
-        uptime = (online_count / len(recent_checks)) * 100
-    
-    return {
-        "id": provider.id,
-        "name": provider.name,
-        "url": provider.url,
-        "description": provider.description,
-        "created_at": provider.created_at,
-        "latest_health": latest_health,
-        "uptime": uptime
-    }
+    return _provider_response(provider, provider_status)
 
 
 @router.put("/{provider_id}", response_model=ProviderResponse)
@@ -162,58 +157,50 @@ async def update_provider(
     provider_id: int,
     provider_data: ProviderUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update a provider"""
-    provider = db.query(Provider).filter(
-        Provider.id == provider_id,
-        Provider.user_id == current_user.id
-    ).first()
-    
-    if not provider:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Provider not found"
-        )
+    provider, provider_status = await _get_user_provider(db, provider_id, current_user)
+    old_group, old_url = provider.group_name, provider.url
     
     # Update fields
     if provider_data.name is not None:
         provider.name = provider_data.name
-    if provider_data.url is not None:
+    if provider_data.url is not None and provider_data.url != provider.url:
         provider.url = provider_data.url
+        # A new endpoint may speak a different protocol; discover it again
+        provider.probe_method = None
+        provider.chain_family = None
     if provider_data.description is not None:
         provider.description = provider_data.description
+    if provider_data.group_name is not None:
+        provider.group_name = provider_data.group_name
     
-    db.commit()
-    db.refresh(provider)
+    await db.commit()
+    await db.refresh(provider)
+    rpc_proxy.invalidate_routes(current_user.id, old_group, provider.group_name)
+    if provider.url != old_url:
+        rpc_proxy.forget_provider(provider.id)
+        provider_capabilities.forget(provider.id)
+    check_scheduler.provider_updated(provider)
     
-    # Get latest health check
-    latest_health = db.query(HealthCheck).filter(
-        HealthCheck.provider_id == provider.id
-    ).order_by(desc(HealthCheck.checked_at)).first()
+    response = _provider_response(provider, provider_status)
+    event_hub.publish(current_user.id, "provider_updated", response)
     
-    return {
-        "id": provider.id,
-        "name": provider.name,
-        "url": provider.url,
-        "description": provider.description,
-        "created_at": provider.created_at,
-        "latest_health": latest_health,
-        "uptime": 100.0
-    }
+    return response
 
 
 @router.delete("/{provider_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_provider(
     provider_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete a provider"""
-    provider = db.query(Provider).filter(
+    provider = await db.scalar(select(Provider).where(
         Provider.id == provider_id,
         Provider.user_id == current_user.id
-    ).first()
+    ))
     
     if not provider:
         raise HTTPException(
@@ -221,8 +208,13 @@ async def delete_provider(
             detail="Provider not found"
         )
     
-    db.delete(provider)
-    db.commit()
+    await db.delete(provider)
+    await db.commit()
+    rpc_proxy.invalidate_routes(current_user.id, provider.group_name)
+    rpc_proxy.forget_provider(provider_id)
+    provider_capabilities.forget(provider_id)
+    check_scheduler.provider_removed(provider_id)
+    event_hub.publish(current_user.id, "provider_deleted", {"id": provider_id})
     
     return None
 
@@ -231,15 +223,15 @@ async def delete_provider(
 async def trigger_health_check(
     provider_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Manually trigger a health check for a provider"""
     from services.health_checker import check_provider_health
     
-    provider = db.query(Provider).filter(
+    provider = await db.scalar(select(Provider).where(
         Provider.id == provider_id,
         Provider.user_id == current_user.id
-    ).first()
+    ))
     
     if not provider:
         raise HTTPException(
@@ -250,4 +242,43 @@ async def trigger_health_check(
     # Perform health check
     health_check = await check_provider_health(provider, db)
     
+    # Deleted while the probe was running
+    if health_check is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Provider not found"
+        )
+    
     return health_check
+
+
+@router.get("/{provider_id}/health-checks/export")
+async def export_provider_health_checks(
+    provider_id: int,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    gzip: bool = False,
+    current_user: User = Depends(get_current_user_or_api_key),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Download a provider's raw health checks as NDJSON or CSV
+
+    Checks in [start, end) are streamed in time order straight from a
+    database cursor, so memory use does not grow with the size of the
+    range. With gzip=true the file is gzip-compressed.
+    """
+    await _get_user_provider(db, provider_id, current_user)
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end"
+        )
+    
+    filename = f"provider-{provider_id}-health-checks.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_health_checks(provider_id, format, start, end, compress=gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,204 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List
+import asyncio
+import json
+
+from database import get_db
+from models import User
+from auth import get_api_key_user
+from services.rpc_cache import rpc_response_cache
+from services.rpc_proxy import (
+    rpc_proxy,
+    rpc_single_flight,
+    coalesce_key,
+    with_request_id,
+    NoUpstreamAvailable,
+    RouteTarget,
+    RPC_PROXY_MAX_BATCH_SIZE
+)
+
+router = APIRouter(prefix="/rpc", tags=["RPC Proxy"])
+
+
+async def _get_targets(db: AsyncSession, user_id: int, group: str) -> List[RouteTarget]:
+    targets = await rpc_proxy.get_route(db, user_id, group)
+    if not targets:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No providers in group '{group}'"
+        )
+    return targets
+
+
+async def _forward(targets: List[RouteTarget], body: bytes):
+    try:
+        return await rpc_proxy.forward(targets, body)
+    except NoUpstreamAvailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"All providers failed ({e})"
+        )
+
+
+def _error_response(request_id, message: str) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32603, "message": message}}
+
+
+async def _forward_each(targets: List[RouteTarget], requests: List[dict]) -> Dict:
+    """Send batch elements as concurrent single requests, for providers without batch support"""
+    async def forward_one(item):
+        try:
+            upstream = await rpc_proxy.forward(targets, json.dumps(item).encode())
+            return json.loads(upstream.content)
+        except (NoUpstreamAvailable, ValueError) as e:
+            return _error_response(item["id"], f"Upstream request failed ({e})")
+
+    results = await asyncio.gather(*(forward_one(item) for item in requests))
+    return {json.dumps(item["id"]): result for item, result in zip(requests, results)}
+
+
+async def _proxy_batch(db: AsyncSession, user_id: int, group: str, payload: list) -> Response:
+    """
+    Proxy a JSON-RPC batch
+
+    Elements found in the response cache are answered locally and only the
+    rest go upstream, as one batch. Responses are merged back in request
+    order. If the provider does not answer with a batch, the remaining
+    elements are sent as concurrent single requests instead.
+    """
+    if not payload or len(payload) > RPC_PROXY_MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch must hold between 1 and {RPC_PROXY_MAX_BATCH_SIZE} requests"
+        )
+
+    ids = [item.get("id") for item in payload if isinstance(item, dict) and "id" in item]
+    if len(ids) != len(set(map(json.dumps, ids))) or not all(isinstance(item, dict) for item in payload):
+        # Responses can only be matched back up by unique ids; pass it through untouched
+        upstream = await _forward(await _get_targets(db, user_id, group), json.dumps(payload).encode())
+        return Response(
+            content=upstream.content,
+            status_code=upstream.status_code,
+            media_type="application/json",
+            headers={"X-RPC-Provider": upstream.target.name, "X-RPC-Cache": "bypass"}
+        )
+
+    cached: Dict = {}
+    misses = []
+    for item in payload:
+        cache_key = rpc_response_cache.key_for(user_id, group, item) if "id" in item else None
+        response = rpc_response_cache.get_response(cache_key, item["id"]) if cache_key is not None else None
+        if response is not None:
+            cached[json.dumps(item["id"])] = response
+        else:
+            misses.append((item, cache_key))
+
+    headers = {"X-RPC-Cache": "hit" if not misses else "partial" if cached else "miss"}
+    fetched: Dict = {}
+    if misses:
+        targets = await _get_targets(db, user_id, group)
+        upstream = await _forward(targets, json.dumps([item for item, _ in misses]).encode())
+        headers["X-RPC-Provider"] = upstream.target.name
+        try:
+            upstream_items = json.loads(upstream.content)
+        except ValueError:
+            upstream_items = None
+
+        if isinstance(upstream_items, list):
+            fetched = {
+                json.dumps(result.get("id")): result
+                for result in upstream_items if isinstance(result, dict)
+            }
+        else:
+            fetched = await _forward_each(targets, [item for item, _ in misses if "id" in item])
+
+        for item, cache_key in misses:
+            result = fetched.get(json.dumps(item.get("id")))
+            if cache_key is not None and result is not None:
+                rpc_response_cache.store(cache_key, json.dumps(result).encode())
+
+    # Notifications (no id) get no response, as in the JSON-RPC spec
+    merged = []
+    for item in payload:
+        if "id" not in item:
+            continue
+        key = json.dumps(item["id"])
+        merged.append(cached.get(key) or fetched.get(key) or _error_response(item["id"], "No response from upstream"))
+
+    if not merged:
+        return Response(status_code=status.HTTP_204_NO_CONTENT, headers=headers)
+    return Response(content=json.dumps(merged), media_type="application/json", headers=headers)
+
+
+@router.post("/{group}")
+async def proxy_rpc(
+    group: str,
+    request: Request,
+    current_user: User = Depends(get_api_key_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Forward a JSON-RPC request or batch to the healthiest provider in a group
+
+    Authenticated with an X-API-Key header. The X-RPC-Provider response
+    header names the provider that served the request. X-RPC-Cache is
+    "hit" or "miss" for cacheable methods and "bypass" for the rest, and
+    X-RPC-Coalesced is "true" when the response was shared with an
+    identical request that was already in flight.
+    """
+    body = await request.body()
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Request body is not valid JSON"
+        )
+
+    if isinstance(payload, list):
+        return await _proxy_batch(db, current_user.id, group, payload)
+
+    cache_key = rpc_response_cache.key_for(current_user.id, group, payload)
+    if cache_key is not None:
+        cached = rpc_response_cache.get(cache_key, payload.get("id"))
+        if cached is not None:
+            return Response(
+                content=cached,
+                media_type="application/json",
+                headers={"X-RPC-Cache": "hit"}
+            )
+    
+    targets = await _get_targets(db, current_user.id, group)
+
+    async def forward_and_cache():
+        upstream = await rpc_proxy.forward(targets, body)
+        if cache_key is not None and upstream.status_code == 200:
+            rpc_response_cache.store(cache_key, upstream.content)
+        return upstream
+
+    # Identical requests already in flight share that upstream call
+    flight_key = coalesce_key(current_user.id, group, payload)
+    try:
+        if flight_key is None:
+            upstream, shared = await forward_and_cache(), False
+        else:
+            upstream, shared = await rpc_single_flight.run(flight_key, forward_and_cache)
+    except NoUpstreamAvailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"All providers failed ({e})"
+        )
+
+    content = with_request_id(upstream.content, payload.get("id")) if shared else upstream.content
+
+    return Response(
+        content=content,
+        status_code=upstream.status_code,
+        media_type="application/json",
+        headers={
+            "X-RPC-Provider": upstream.target.name,
+            "X-RPC-Cache": "miss" if cache_key is not None else "bypass",
+            "X-RPC-Coalesced": "true" if shared else "false"
+        }
+    )
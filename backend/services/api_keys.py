@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import ApiKey
+
+load_dotenv()
+
+KEY_PREFIX_LENGTH = 12
+# How long the in-memory index is trusted before it is reloaded in full...
+API_KEY_INDEX_REFRESH_SECONDS = float(os.getenv("API_KEY_INDEX_REFRESH_SECONDS", "60"))
+# ...and how often it checks whether keys were created or revoked elsewhere,
+# which bounds how long a key revoked by another worker keeps working here
+API_KEY_INDEX_CHECK_SECONDS = float(os.getenv("API_KEY_INDEX_CHECK_SECONDS", "5"))
+API_KEY_LAST_USED_FLUSH_SECONDS = int(os.getenv("API_KEY_LAST_USED_FLUSH_SECONDS", "30"))
+
+
+def generate_api_key() -> str:
+    return f"rpc_{secrets.token_urlsafe(32)}"
+
+
+def hash_api_key(key: str) -> str:
+    """Keys are random and high-entropy, so a plain SHA-256 is enough to store them"""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def mask_api_key(key_prefix: Optional[str]) -> str:
+    return f"{key_prefix or 'rpc_'}…"
+
+
+class ApiKeyIndex:
+    """
+    In-memory index of active keys
+
+    Keys are grouped by their non-secret prefix, and the SHA-256 digest of a
+    presented key is compared against each candidate with
+    hmac.compare_digest. Keys created or revoked in this process are applied
+    directly. A key missing from the index is looked up by its digest, so a
+    key just created by another worker works at once. Every
+    API_KEY_INDEX_CHECK_SECONDS the active key count, highest id and latest
+    updated_at are compared with the last reload, and the index is reloaded
+    when they changed, so keys revoked by other workers stop working here
+    too. The whole index is also reloaded once it is older than
+    API_KEY_INDEX_REFRESH_SECONDS.
+    """
+
+    def __init__(
+        self,
+        refresh_seconds: float = API_KEY_INDEX_REFRESH_SECONDS,
+        check_seconds: float = API_KEY_INDEX_CHECK_SECONDS
+    ):
+        self.refresh_seconds = refresh_seconds
+        self.check_seconds = check_seconds
+        self._by_prefix: Dict[str, List[Tuple[str, int, int]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._checked_at: Optional[float] = None
+        self._signature: Optional[tuple] = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._by_prefix.values())
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_seconds
+
+    def is_check_due(self) -> bool:
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.check_seconds
+
+    async def _current_signature(self, db: AsyncSession) -> tuple:
+        return tuple((await db.execute(
+            select(
+                func.count(ApiKey.id).filter(ApiKey.is_active == True),
+                func.max(ApiKey.id),
+                func.max(ApiKey.updated_at)
+            )
+        )).one())
+
+    async def reload(self, db: AsyncSession):
+        self._signature = await self._current_signature(db)
+        rows = (await db.execute(
+            select(ApiKey.key_prefix, ApiKey.key, ApiKey.id, ApiKey.user_id).where(ApiKey.is_active == True)
+        )).all()
+        by_prefix: Dict[str, List[Tuple[str, int, int]]] = {}
+        for key_prefix, key_hash, key_id, user_id in rows:
+            by_prefix.setdefault(key_prefix, []).append((key_hash, key_id, user_id))
+        self._by_prefix = by_prefix
+        self._loaded_at = self._checked_at = time.monotonic()
+
+    def add(self, key_prefix: str, key_hash: str, key_id: int, user_id: int):
+        self._by_prefix.setdefault(key_prefix, []).append((key_hash, key_id, user_id))
+
+    def remove(self, key_prefix: str, key_id: int):
+        entries = [entry for entry in self._by_prefix.get(key_prefix, []) if entry[1] != key_id]
+        if entries:
+            self._by_prefix[key_prefix] = entries
+        else:
+            self._by_prefix.pop(key_prefix, None)
+
+    async def lookup(self, key: str, db: AsyncSession) -> Optional[Tuple[int, int]]:
+        """Return (key id, user id) for an active key, or None"""
+        if self.is_stale() or self.is_check_due():
+            async with self._lock:
+                if self.is_stale():
+                    await self.reload(db)
+                elif self.is_check_due():
+                    self._checked_at = time.monotonic()
+                    if await self._current_signature(db) != self._signature:
+                        await self.reload(db)
+
+        key_hash = hash_api_key(key)
+        match = None
+        for stored_hash, key_id, user_id in self._by_prefix.get(key[:KEY_PREFIX_LENGTH], []):
+            if hmac.compare_digest(stored_hash, key_hash):
+                match = (key_id, user_id)
+        if match is not None:
+            return match
+
+        # Created by another worker since the last reload; the digest is a unique index
+        row = (await db.execute(
+            select(ApiKey.key_prefix, ApiKey.id, ApiKey.user_id).where(
+                ApiKey.key == key_hash,
+                ApiKey.is_active == True
+            )
+        )).first()
+        if row is None:
+            return None
+        self.add(row.key_prefix, key_hash, row.id, row.user_id)
+        return (row.id, row.user_id)
+
+
+class LastUsedTracker:
+    """
+    Coalesces last_used updates so authenticated requests never write
+
+    Each request only records the time in memory; flush() writes the latest
+    time per key in one executemany UPDATE.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        self._pending: Dict[int, datetime] = {}
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def touch(self, key_id: int, used_at: Optional[datetime] = None):
+        self._pending[key_id] = used_at or datetime.utcnow()
+
+    async def flush(self) -> int:
+        """Write pending last_used times; returns the number of keys updated"""
+        async with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(
+                        # Leave updated_at alone: a last_used write is not an edit the key index cares about
+                        update(ApiKey.__table__).where(ApiKey.__table__.c.id == bindparam("key_id")).values(
+                            updated_at=ApiKey.__table__.c.updated_at
+                        ),
+                        [{"key_id": key_id, "last_used": used_at} for key_id, used_at in pending.items()]
+                    )
+                    await db.commit()
+            except Exception:
+                # Keep the times for the next flush unless a newer one arrived
+                for key_id, used_at in pending.items():
+                    self._pending.setdefault(key_id, used_at)
+                raise
+            return len(pending)
+
+
+api_key_index = ApiKeyIndex()
+last_used_tracker = LastUsedTracker()
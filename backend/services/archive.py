@@ -0,0 +1,365 @@
+import asyncio
+import functools
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import HealthCheck, HealthCheckRollup
+from services.rollups import LATENCY_BUCKETS_MS, estimate_percentile
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+load_dotenv()
+
+# Raw health checks aged out by retention are moved here instead of being
+# dropped. Needs pyarrow; without it retention deletes them as before.
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() == "true"
+# Every process that serves analytics must see the same directory
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+# Rows deleted per transaction once a provider-day has been written out
+ARCHIVE_DELETE_BATCH_SIZE = int(os.getenv("ARCHIVE_DELETE_BATCH_SIZE", "1000"))
+ARCHIVE_DELETE_PAUSE_SECONDS = float(os.getenv("ARCHIVE_DELETE_PAUSE_SECONDS", "0.05"))
+# Archived rows aggregated per step when scanning for analytics
+ARCHIVE_SCAN_ROWS = int(os.getenv("ARCHIVE_SCAN_ROWS", "65536"))
+
+LATENCY_PERCENTILES = (0.5, 0.95, 0.99)
+
+_PART_NAME = re.compile(r"^part-(\d+)-(\d+)\.parquet$")
+
+if pa is not None:
+    ARCHIVE_SCHEMA = pa.schema([
+        ("id", pa.int64()),
+        ("status", pa.dictionary(pa.int8(), pa.string())),
+        ("response_time_ms", pa.float64()),
+        ("error_message", pa.string()),
+        ("checked_at", pa.timestamp("us")),
+    ])
+    # provider_id=<id>/day=<YYYY-MM-DD> directories
+    ARCHIVE_PARTITION_SCHEMA = pa.schema([("provider_id", pa.int64()), ("day", pa.string())])
+    ARCHIVE_DATASET_SCHEMA = pa.schema(list(ARCHIVE_SCHEMA) + list(ARCHIVE_PARTITION_SCHEMA))
+
+
+def archive_enabled() -> bool:
+    return ARCHIVE_ENABLED and pa is not None
+
+
+def _provider_dir(provider_id: int) -> str:
+    return os.path.join(ARCHIVE_DIR, f"provider_id={provider_id}")
+
+
+def _partition_dir(provider_id: int, day: date) -> str:
+    return os.path.join(_provider_dir(provider_id), f"day={day.isoformat()}")
+
+
+def archived_days(provider_id: int) -> List[date]:
+    """Days with an archive partition for the provider, oldest first"""
+    try:
+        names = os.listdir(_provider_dir(provider_id))
+    except FileNotFoundError:
+        return []
+    return sorted(
+        date.fromisoformat(name[len("day="):])
+        for name in names if name.startswith("day=")
+    )
+
+
+def _parts(partition: str) -> List[Tuple[str, int, int]]:
+    """(path, first id, last id) of each file in a partition"""
+    try:
+        names = os.listdir(partition)
+    except FileNotFoundError:
+        return []
+    parts = []
+    for name in names:
+        match = _PART_NAME.match(name)
+        if match:
+            parts.append((os.path.join(partition, name), int(match.group(1)), int(match.group(2))))
+    return parts
+
+
+def _delete_ids(db: Session, ids: Sequence[int]):
+    for offset in range(0, len(ids), ARCHIVE_DELETE_BATCH_SIZE):
+        db.execute(
+            delete(HealthCheck).where(HealthCheck.id.in_(ids[offset:offset + ARCHIVE_DELETE_BATCH_SIZE])),
+            execution_options={"synchronize_session": False}
+        )
+        db.commit()
+        time.sleep(ARCHIVE_DELETE_PAUSE_SECONDS)
+
+
+def archive_provider_day(db: Session, provider_id: int, day: date) -> int:
+    """
+    Move one provider-day of raw health checks into its Parquet partition
+
+    The rows are written to a new part file named after their first and
+    last id, then deleted from the table. A run interrupted after the file
+    was written only deletes on the next run: rows whose id falls inside
+    an existing part of the partition are already archived, since ids only
+    grow and a part holds every row of its id range.
+
+    Returns the number of rows written.
+    """
+    start = datetime.combine(day, datetime.min.time())
+    rows = db.execute(
+        select(
+            HealthCheck.id,
+            HealthCheck.status,
+            HealthCheck.response_time_ms,
+            HealthCheck.error_message,
+            HealthCheck.checked_at
+        ).where(
+            HealthCheck.provider_id == provider_id,
+            HealthCheck.checked_at >= start,
+            HealthCheck.checked_at < start + timedelta(days=1)
+        ).order_by(HealthCheck.id)
+    ).all()
+    if not rows:
+        return 0
+
+    partition = _partition_dir(provider_id, day)
+    ranges = [(first, last) for _, first, last in _parts(partition)]
+    fresh = [row for row in rows if not any(first <= row.id <= last for first, last in ranges)]
+
+    if fresh:
+        os.makedirs(partition, exist_ok=True)
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(zip(*fresh), ARCHIVE_SCHEMA)],
+            schema=ARCHIVE_SCHEMA
+        )
+        path = os.path.join(partition, f"part-{fresh[0].id}-{fresh[-1].id}.parquet")
+        # Readers only ever see complete files
+        pq.write_table(table, path + ".tmp", compression=ARCHIVE_COMPRESSION)
+        os.replace(path + ".tmp", path)
+
+    _delete_ids(db, [row.id for row in rows])
+    return len(fresh)
+
+
+def archive_before(db: Session, cutoff: datetime) -> dict:
+    """
+    Archive every whole provider-day of raw health checks before the cutoff
+
+    Each provider-day is read, written and deleted on its own, so memory
+    holds one day of one provider at a time.
+    """
+    day = func.date(HealthCheck.checked_at)
+    provider_days = db.execute(
+        select(HealthCheck.provider_id, day)
+        .where(HealthCheck.checked_at < cutoff)
+        .group_by(HealthCheck.provider_id, day)
+        .order_by(day, HealthCheck.provider_id)
+    ).all()
+
+    archived = 0
+    for provider_id, raw_day in provider_days:
+        archived += archive_provider_day(db, provider_id, date.fromisoformat(str(raw_day)))
+
+    return {"archived_days": len(provider_days), "health_checks_archived": archived}
+
+
+class HistoryTotals:
+    """Check counts and a latency histogram for one provider, summed over days"""
+
+    def __init__(self):
+        self.check_count = 0
+        self.online_count = 0
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.latency_min: Optional[float] = None
+        self.latency_max: Optional[float] = None
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(
+        self,
+        check_count: int,
+        online_count: int,
+        latency_count: int = 0,
+        latency_sum: Optional[float] = None,
+        latency_min: Optional[float] = None,
+        latency_max: Optional[float] = None,
+        histogram: Iterable[Tuple[int, int]] = ()
+    ):
+        """Fold in a group of checks; histogram holds (bucket index, count) pairs"""
+        self.check_count += check_count
+        self.online_count += online_count
+        if not latency_count:
+            return
+        self.latency_count += latency_count
+        self.latency_sum += latency_sum
+        self.latency_min = latency_min if self.latency_min is None else min(self.latency_min, latency_min)
+        self.latency_max = latency_max if self.latency_max is None else max(self.latency_max, latency_max)
+        for index, count in histogram:
+            self.histogram[index] += count
+
+    def summary(self) -> dict:
+        latency = None
+        if self.latency_count:
+            latency = {
+                "min": self.latency_min,
+                "avg": self.latency_sum / self.latency_count,
+                "max": self.latency_max
+            }
+            for q in LATENCY_PERCENTILES:
+                latency[f"p{round(q * 100)}"] = estimate_percentile(
+                    self.histogram, q, self.latency_min, self.latency_max
+                )
+        return {
+            "checks": self.check_count,
+            "online_checks": self.online_count,
+            "uptime": round(self.online_count * 100.0 / self.check_count, 3) if self.check_count else None,
+            "latency_ms": latency
+        }
+
+
+def _fold_archived(totals: Dict[int, HistoryTotals], table):
+    """Add a table of archived checks to the totals, grouped by provider and latency bucket"""
+    latency = table.column("response_time_ms")
+    # Same buckets as the rollups: the count of upper bounds below the latency
+    bucket = functools.reduce(pc.add, [
+        pc.greater(latency, upper).cast(pa.int8()) for upper in LATENCY_BUCKETS_MS
+    ])
+    groups = pa.table({
+        "provider_id": table.column("provider_id"),
+        "bucket": pc.fill_null(bucket, -1),
+        "online": pc.equal(table.column("status"), "online").cast(pa.int64()),
+        "latency": latency
+    }).group_by(["provider_id", "bucket"]).aggregate([
+        ("online", "count"),
+        ("online", "sum"),
+        ("latency", "count"),
+        ("latency", "sum"),
+        ("latency", "min"),
+        ("latency", "max")
+    ])
+    for group in groups.to_pylist():
+        totals[group["provider_id"]].add(
+            group["online_count"],
+            group["online_sum"],
+            group["latency_count"],
+            group["latency_sum"],
+            group["latency_min"],
+            group["latency_max"],
+            [(group["bucket"], group["latency_count"])] if group["bucket"] >= 0 else ()
+        )
+
+
+def scan_archive(provider_ids: Iterable[int], first_day: date, last_day: date) -> Tuple[Dict[int, HistoryTotals], Dict[int, Set[date]]]:
+    """
+    Sum up the providers' archived checks from first_day to last_day in one pass
+
+    Only the partitions of those days are opened, and only the provider,
+    status and latency columns are decoded. Record batches are streamed
+    and grouped by provider and latency bucket with Arrow compute kernels
+    a pool at a time, so memory does not grow with the window. Returns the
+    totals and the archived days in range, per provider.
+    """
+    totals: Dict[int, HistoryTotals] = defaultdict(HistoryTotals)
+    archived: Dict[int, Set[date]] = {}
+    paths = []
+    for provider_id in provider_ids:
+        days = [day for day in archived_days(provider_id) if first_day <= day <= last_day]
+        if days:
+            archived[provider_id] = set(days)
+        paths.extend(
+            path for day in days for path, _, _ in _parts(_partition_dir(provider_id, day))
+        )
+    if not paths:
+        return totals, archived
+
+    dataset = ds.dataset(
+        paths,
+        schema=ARCHIVE_DATASET_SCHEMA,
+        format="parquet",
+        partitioning=ds.partitioning(ARCHIVE_PARTITION_SCHEMA, flavor="hive"),
+        partition_base_dir=ARCHIVE_DIR
+    )
+    # Files hold one provider-day each, so small batches are pooled to keep
+    # the per-call overhead of the compute kernels down
+    pending, pending_rows = [], 0
+    for batch in dataset.to_batches(columns=["provider_id", "status", "response_time_ms"]):
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows >= ARCHIVE_SCAN_ROWS:
+            _fold_archived(totals, pa.Table.from_batches(pending).combine_chunks())
+            pending, pending_rows = [], 0
+    if pending:
+        _fold_archived(totals, pa.Table.from_batches(pending).combine_chunks())
+    return totals, archived
+
+
+async def health_check_stats(
+    db: AsyncSession,
+    provider_ids: List[int],
+    start: datetime,
+    end: datetime
+) -> Dict[int, dict]:
+    """
+    Uptime and latency of several providers from the day starting at start
+    up to end, across the archive and the database
+
+    Days with an archive partition come from one scan of the archive, run
+    in a thread, and every other day from one query of the day rollups, so
+    a day that is part way through being archived is never counted twice
+    and a day that was never archived is not lost. Percentiles are estimated from the merged latency
+    histograms, like the rollups' p95.
+    """
+    if pa is not None:
+        totals, archived = await asyncio.to_thread(scan_archive, provider_ids, start.date(), end.date())
+    else:
+        totals, archived = defaultdict(HistoryTotals), {}
+    archived_checks = {provider_id: totals[provider_id].check_count for provider_id in provider_ids}
+
+    rollups = (await db.execute(
+        select(
+            HealthCheckRollup.provider_id,
+            HealthCheckRollup.bucket_start,
+            HealthCheckRollup.check_count,
+            HealthCheckRollup.online_count,
+            HealthCheckRollup.latency_count,
+            HealthCheckRollup.latency_sum,
+            HealthCheckRollup.latency_min,
+            HealthCheckRollup.latency_max,
+            HealthCheckRollup.latency_histogram
+        ).where(
+            HealthCheckRollup.provider_id.in_(provider_ids),
+            HealthCheckRollup.granularity == "day",
+            HealthCheckRollup.bucket_start >= start,
+            HealthCheckRollup.bucket_start < end
+        )
+    )).all()
+    for row in rollups:
+        if row.bucket_start.date() in archived.get(row.provider_id, ()):
+            continue
+        totals[row.provider_id].add(
+            row.check_count,
+            row.online_count,
+            row.latency_count,
+            row.latency_sum,
+            row.latency_min,
+            row.latency_max,
+            enumerate(json.loads(row.latency_histogram)) if row.latency_histogram else ()
+        )
+
+    return {
+        provider_id: {
+            **totals[provider_id].summary(),
+            "archived_checks": archived_checks[provider_id],
+            "live_checks": totals[provider_id].check_count - archived_checks[provider_id]
+        }
+        for provider_id in provider_ids
+    }
@@ -6,51 +6,201 @@ import os
 from dotenv import load_dotenv
 
 from database import SessionLocal
-from services.health_checker import check_all_providers
+from services.check_scheduler import check_scheduler
+from services.write_buffer import write_buffer, WRITE_BUFFER_MAX_AGE_SECONDS
+from services.retention import run_retention, run_maintenance
+from services.api_keys import last_used_tracker, API_KEY_LAST_USED_FLUSH_SECONDS
+from services.coordination import coordinator, WORKER_HEARTBEAT_SECONDS, WORKER_COORDINATION_ENABLED
+from services.event_hub import event_hub
+from services.event_relay import event_relay, EVENT_RELAY_POLL_SECONDS
 
 load_dotenv()
 
+# Set to false on API servers when probe_worker.py runs the health checks
+RUN_BACKGROUND_TASKS = os.getenv("RUN_BACKGROUND_TASKS", "true").lower() == "true"
+# Relay health check changes from the database to event streams; needed when
+# another process writes them. Defaults to on when health checks run elsewhere
+# or are split between workers, which coordination does for --workers N.
+EVENT_RELAY_ENABLED = os.getenv(
+    "EVENT_RELAY_ENABLED", str(not RUN_BACKGROUND_TASKS or WORKER_COORDINATION_ENABLED)
+).lower() == "true"
+
 scheduler = AsyncIOScheduler()
 
 
-async def scheduled_health_check():
+async def worker_heartbeat():
+    """
+    Scheduled task to renew this worker's lease and rebalance providers
+    """
+    try:
+        await coordinator.heartbeat()
+    except Exception as e:
+        print(f"Error in worker heartbeat: {e}")
+
+
+async def relay_events():
     """
-    Scheduled task to check all providers' health
+    Scheduled task to publish health check changes written by other processes
     """
-    print(f"[{datetime.utcnow()}] Running scheduled health check...")
+    try:
+        await event_relay.poll()
+    except Exception as e:
+        print(f"Error relaying events: {e}")
+
+
+async def flush_write_buffer():
+    """
+    Scheduled task to write buffered health checks once they age out
+    """
+    try:
+        await write_buffer.flush_if_due()
+    except Exception as e:
+        print(f"Error flushing health check buffer: {e}")
+
+
+async def flush_api_key_last_used():
+    """
+    Scheduled task to write the coalesced API key last_used times
+    """
+    try:
+        await last_used_tracker.flush()
+    except Exception as e:
+        print(f"Error flushing API key last_used times: {e}")
+
+
+def scheduled_retention():
+    """
+    Scheduled task to prune old health checks, alerts and rollups
+
+    Runs in the scheduler's thread pool so batch deletes never block the
+    event loop. Only the leader worker runs it.
+    """
+    if not coordinator.is_leader:
+        return
+    print(f"[{datetime.utcnow()}] Running retention...")
     db = SessionLocal()
     try:
-        await check_all_providers(db)
-        print(f"[{datetime.utcnow()}] Health check completed")
+        summary = run_retention(db)
+        print(f"[{datetime.utcnow()}] Retention completed: {summary}")
     except Exception as e:
-        print(f"Error in scheduled health check: {e}")
+        db.rollback()
+        print(f"Error in scheduled retention: {e}")
     finally:
         db.close()
 
 
-def start_background_tasks():
+def scheduled_maintenance(vacuum: bool = False):
+    """
+    Scheduled task to run ANALYZE, and VACUUM when requested
+
+    Only the leader worker runs it.
+    """
+    if not coordinator.is_leader:
+        return
+    try:
+        run_maintenance(vacuum=vacuum)
+        print(f"[{datetime.utcnow()}] Database {'VACUUM/ANALYZE' if vacuum else 'ANALYZE'} completed")
+    except Exception as e:
+        print(f"Error in scheduled database maintenance: {e}")
+
+
+def start_background_tasks(health_checks: bool = RUN_BACKGROUND_TASKS):
     """
     Start all background tasks
+
+    With health_checks=False only the jobs that serve this process's own
+    requests run. Probing, worker coordination, retention and maintenance
+    are left to probe_worker.py.
     """
-    # Get interval from environment (default 5 minutes)
-    interval_minutes = int(os.getenv("HEALTH_CHECK_INTERVAL_MINUTES", "5"))
+    scheduler.add_job(
+        flush_api_key_last_used,
+        trigger=IntervalTrigger(seconds=API_KEY_LAST_USED_FLUSH_SECONDS),
+        id="api_key_last_used_flush",
+        name="API Key last_used Flush",
+        replace_existing=True
+    )
+    
+    if EVENT_RELAY_ENABLED:
+        event_hub.relayed = True
+        scheduler.add_job(
+            relay_events,
+            trigger=IntervalTrigger(seconds=EVENT_RELAY_POLL_SECONDS),
+            id="event_relay",
+            name="Event Relay",
+            replace_existing=True
+        )
+    
+    if not health_checks:
+        scheduler.start()
+        print("Background tasks started. Health checks run in probe workers.")
+        return
+    
+    # Workers sharing the database split the providers between them
+    check_scheduler.owns = coordinator.owns
+    coordinator.on_rebalance = check_scheduler.resync
+    scheduler.add_job(
+        worker_heartbeat,
+        trigger=IntervalTrigger(seconds=WORKER_HEARTBEAT_SECONDS),
+        id="worker_heartbeat",
+        name="Worker Lease Heartbeat",
+        next_run_time=datetime.now(),
+        replace_existing=True
+    )
     
-    # Schedule health checks
+    # Health checks run on their own dispatcher, with a due time per provider
+    check_scheduler.start()
+    
+    # Time-based flush for results buffered outside a full sweep
+    scheduler.add_job(
+        flush_write_buffer,
+        trigger=IntervalTrigger(seconds=WRITE_BUFFER_MAX_AGE_SECONDS),
+        id="write_buffer_flush",
+        name="Health Check Write Buffer Flush",
+        replace_existing=True
+    )
+    
+    # Retention and database maintenance
+    retention_hours = int(os.getenv("RETENTION_INTERVAL_HOURS", "6"))
+    analyze_hours = int(os.getenv("DB_ANALYZE_INTERVAL_HOURS", "24"))
+    vacuum_hours = int(os.getenv("DB_VACUUM_INTERVAL_HOURS", "168"))
+    
+    scheduler.add_job(
+        scheduled_retention,
+        trigger=IntervalTrigger(hours=retention_hours),
+        id="retention",
+        name="Health Check Retention",
+        replace_existing=True
+    )
     scheduler.add_job(
-        scheduled_health_check,
-        trigger=IntervalTrigger(minutes=interval_minutes),
-        id="health_check",
-        name="Provider Health Check",
+        scheduled_maintenance,
+        trigger=IntervalTrigger(hours=analyze_hours),
+        id="db_analyze",
+        name="Database ANALYZE",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        scheduled_maintenance,
+        trigger=IntervalTrigger(hours=vacuum_hours),
+        kwargs={"vacuum": True},
+        id="db_vacuum",
+        name="Database VACUUM",
         replace_existing=True
     )
     
     scheduler.start()
-    print(f"Background tasks started. Health checks every {interval_minutes} minutes.")
+    print("Background tasks started.")
 
 
-def stop_background_tasks():
+async def stop_background_tasks():
     """
     Stop all background tasks
     """
+    await check_scheduler.stop()
     scheduler.shutdown()
+    try:
+        await coordinator.release()
+    except Exception as e:
+        print(f"Error releasing worker lease: {e}")
+    await write_buffer.flush()
+    await flush_api_key_last_used()
     print("Background tasks stopped.")
@@ -0,0 +1,80 @@
+import os
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Consecutive failed probes with a known method before it is discovered again
+PROBE_REDISCOVER_AFTER_FAILURES = int(os.getenv("PROBE_REDISCOVER_AFTER_FAILURES", "3"))
+
+CHAIN_FAMILIES = {
+    "getBlockCount": "blockdag",
+    "getInfo": "blockdag",
+    "eth_blockNumber": "evm",
+    "net_version": "generic",
+}
+
+
+class Capability:
+    def __init__(self, url: str, method: Optional[str], chain_family: Optional[str]):
+        self.url = url
+        self.method = method
+        self.chain_family = chain_family
+        self.failures = 0
+
+
+class ProviderCapabilities:
+    """
+    In-memory probe method per provider
+
+    Seeded from Provider.probe_method / chain_family the first time a
+    provider is probed. A provider with a known method is probed with just
+    that method; after PROBE_REDISCOVER_AFTER_FAILURES consecutive failed
+    probes, or when its URL changes, the method is dropped and the next
+    probe discovers it again.
+    """
+
+    def __init__(self, rediscover_after: int = PROBE_REDISCOVER_AFTER_FAILURES):
+        self.rediscover_after = max(1, rediscover_after)
+        self._known: Dict[int, Capability] = {}
+
+    def method_for(self, provider_id: int, url: str, stored_method: Optional[str] = None,
+                   stored_family: Optional[str] = None) -> Optional[str]:
+        """Probe method to use for a provider, or None to run discovery"""
+        capability = self._known.get(provider_id)
+        if capability is None or capability.url != url:
+            capability = self._known[provider_id] = Capability(url, stored_method, stored_family)
+        return capability.method
+
+    def observe(self, provider_id: int, result: dict) -> Optional[dict]:
+        """
+        Update from a probe result
+
+        Returns the probe_method / chain_family values to persist when they
+        changed, otherwise None.
+        """
+        capability = self._known.get(provider_id)
+        if capability is None:
+            return None
+
+        if result["status"] == "online":
+            capability.failures = 0
+            discovered = result.get("probe_method")
+            if discovered and discovered != capability.method:
+                capability.method = discovered
+                capability.chain_family = CHAIN_FAMILIES.get(discovered, capability.chain_family)
+                return {"probe_method": capability.method, "chain_family": capability.chain_family}
+            return None
+
+        capability.failures += 1
+        if capability.method is not None and capability.failures >= self.rediscover_after:
+            capability.method = None
+            capability.failures = 0
+            return {"probe_method": None, "chain_family": capability.chain_family}
+        return None
+
+    def forget(self, provider_id: int):
+        self._known.pop(provider_id, None)
+
+
+provider_capabilities = ProviderCapabilities()
@@ -0,0 +1,383 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+
+from database import AsyncSessionLocal
+from models import Provider, ProviderStatus
+from services.health_checker import ProbeSweeper, check_providers
+from services.write_buffer import HealthCheckWriteBuffer, write_buffer
+
+load_dotenv()
+
+# Interval for providers with a short or mixed history
+HEALTH_CHECK_BASE_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_INTERVAL_MINUTES", "5")) * 60
+# Failing providers are checked this often...
+HEALTH_CHECK_MIN_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_MIN_INTERVAL_SECONDS", "30"))
+# ...and providers that have been stable for a long time this often
+HEALTH_CHECK_MAX_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_MAX_INTERVAL_SECONDS", "1800"))
+# Consecutive online checks that count as one stable window
+HEALTH_CHECK_STABILITY_WINDOW = int(os.getenv("HEALTH_CHECK_STABILITY_WINDOW", "10"))
+# Each interval is randomly stretched or shrunk by up to this fraction
+HEALTH_CHECK_JITTER = float(os.getenv("HEALTH_CHECK_JITTER", "0.1"))
+# Most providers handed to one check_providers() call
+HEALTH_CHECK_DISPATCH_BATCH = int(os.getenv("HEALTH_CHECK_DISPATCH_BATCH", "500"))
+# How often the provider list is reloaded, for changes made outside the API...
+HEALTH_CHECK_RESYNC_SECONDS = float(os.getenv("HEALTH_CHECK_RESYNC_SECONDS", "300"))
+# ...and how often the provider count, highest id and last edit are compared,
+# to reload sooner when other processes add, edit or delete providers
+HEALTH_CHECK_CHANGE_POLL_SECONDS = float(os.getenv("HEALTH_CHECK_CHANGE_POLL_SECONDS", "10"))
+
+
+def check_interval(consecutive_failures: int, online_streak: int, checks: int) -> float:
+    """
+    Seconds until a provider's next check, before jitter
+
+    Failing providers get the minimum interval and providers that failed
+    within the last stability window get half the base interval. After that
+    the interval doubles for every full stable window of online checks, up
+    to the maximum. online_streak is the number of online checks since the
+    last failure and checks the number of checks in the provider's history.
+    """
+    if consecutive_failures:
+        return HEALTH_CHECK_MIN_INTERVAL_SECONDS
+
+    window = max(1, HEALTH_CHECK_STABILITY_WINDOW)
+    if online_streak < checks and online_streak < window:
+        return max(HEALTH_CHECK_MIN_INTERVAL_SECONDS, HEALTH_CHECK_BASE_INTERVAL_SECONDS / 2)
+
+    interval = HEALTH_CHECK_BASE_INTERVAL_SECONDS * 2 ** (online_streak // window)
+    return min(HEALTH_CHECK_MAX_INTERVAL_SECONDS, max(HEALTH_CHECK_MIN_INTERVAL_SECONDS, interval))
+
+
+def _jittered(seconds: float) -> float:
+    return seconds * random.uniform(1 - HEALTH_CHECK_JITTER, 1 + HEALTH_CHECK_JITTER)
+
+
+class DueQueue:
+    """
+    Min-heap of provider ids ordered by due time
+
+    schedule() and pop_due() are O(log n) and peek() is O(1) amortized.
+    Rescheduling or removing a provider leaves its old heap entry behind;
+    stale entries are skipped when they reach the top, and the heap is
+    rebuilt once they outnumber the live ones.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, int]] = []
+        self._entries: Dict[int, Tuple[float, int]] = {}
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, provider_id: int) -> bool:
+        return provider_id in self._entries
+
+    def due_at(self, provider_id: int) -> Optional[float]:
+        entry = self._entries.get(provider_id)
+        return entry[0] if entry else None
+
+    def schedule(self, provider_id: int, due: float):
+        """Set a provider's due time, replacing any earlier one"""
+        sequence = next(self._sequence)
+        self._entries[provider_id] = (due, sequence)
+        heapq.heappush(self._heap, (due, sequence, provider_id))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def remove(self, provider_id: int):
+        self._entries.pop(provider_id, None)
+
+    def _is_live(self, item: Tuple[float, int, int]) -> bool:
+        due, sequence, provider_id = item
+        return self._entries.get(provider_id) == (due, sequence)
+
+    def _compact(self):
+        self._heap = [(due, sequence, provider_id) for provider_id, (due, sequence) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def peek(self) -> Optional[float]:
+        """Earliest due time, or None when nothing is scheduled"""
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float, limit: Optional[int] = None) -> List[int]:
+        """Remove and return the providers due at or before now, earliest first"""
+        due = []
+        while self._heap and (limit is None or len(due) < limit):
+            item = self._heap[0]
+            if not self._is_live(item):
+                heapq.heappop(self._heap)
+                continue
+            if item[0] > now:
+                break
+            heapq.heappop(self._heap)
+            del self._entries[item[2]]
+            due.append(item[2])
+        return due
+
+
+class ScheduledProvider:
+    """The fields a probe needs, plus the history that sets the next interval"""
+
+    def __init__(self, provider: Provider, provider_status: Optional[ProviderStatus] = None):
+        self.id = provider.id
+        # Set on delete, so a probe already in flight is not written
+        self.removed = False
+        self.refresh(provider)
+        outcomes = (provider_status.recent_outcomes or "") if provider_status else ""
+        self.consecutive_failures = (provider_status.consecutive_failures or 0) if provider_status else 0
+        self.online_streak = len(outcomes) - len(outcomes.rstrip("1"))
+        self.checks = len(outcomes)
+
+    def refresh(self, provider: Provider):
+        self.name = provider.name
+        self.url = provider.url
+        self.probe_method = provider.probe_method
+        self.chain_family = provider.chain_family
+
+    def record(self, online: bool):
+        """Same fold as provider_status, without reading the row back"""
+        self.checks += 1
+        if online:
+            self.consecutive_failures = 0
+            self.online_streak += 1
+        else:
+            self.consecutive_failures += 1
+            self.online_streak = 0
+
+    def interval(self) -> float:
+        return check_interval(self.consecutive_failures, self.online_streak, self.checks)
+
+
+class ProviderCheckScheduler:
+    """
+    Gives every provider its own next-check time
+
+    Providers are kept in memory with their due times in a DueQueue. A
+    dispatcher task sleeps until the earliest due time, hands the providers
+    that are due to check_providers() and schedules each one's next check
+    from check_interval(). The providers router reports creates, updates and
+    deletes, which take effect right away. Changes made by other processes
+    are picked up by reloading the list every HEALTH_CHECK_RESYNC_SECONDS,
+    or sooner when the provider count, highest id or last edit changes.
+
+    When owns is given, only the providers it accepts are scheduled; the
+    worker coordinator uses this to shard providers across processes.
+
+    Providers never checked before are due right away. Providers already
+    known at startup are spread randomly over their first interval, so the
+    whole fleet is not probed at the same moment.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        sweeper: Optional[ProbeSweeper] = None,
+        buffer: Optional[HealthCheckWriteBuffer] = None,
+        owns: Optional[Callable[[int], bool]] = None
+    ):
+        self.session_factory = session_factory
+        # One sweeper for every group, so the concurrency limits hold across them
+        self.sweeper = sweeper or ProbeSweeper()
+        self.buffer = buffer
+        self.owns = owns
+        self.queue = DueQueue()
+        self._providers: Dict[int, ScheduledProvider] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._checks = set()
+        self._last_sync = 0.0
+        self._last_poll = 0.0
+        self._signature: Optional[tuple] = None
+        self._loaded = False
+
+    def __len__(self) -> int:
+        return len(self._providers)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _wake(self):
+        self._wakeup.set()
+
+    def _schedule_first(self, scheduled: ScheduledProvider, now: float):
+        if scheduled.checks == 0:
+            self.queue.schedule(scheduled.id, now)
+        else:
+            self.queue.schedule(scheduled.id, now + random.uniform(0, scheduled.interval()))
+
+    def _owned(self, provider_id: int) -> bool:
+        # Events before the first load are left to it, and ignored where checks never run
+        return self._loaded and (self.owns is None or self.owns(provider_id))
+
+    def provider_added(self, provider: Provider):
+        """A new provider is checked right away"""
+        if not self._owned(provider.id):
+            return
+        self._providers[provider.id] = ScheduledProvider(provider)
+        self.queue.schedule(provider.id, time.monotonic())
+        self._wake()
+
+    def provider_updated(self, provider: Provider):
+        """A provider whose URL changed is checked right away"""
+        if not self._owned(provider.id):
+            return
+        scheduled = self._providers.get(provider.id)
+        if scheduled is None:
+            self.provider_added(provider)
+            return
+        url_changed = scheduled.url != provider.url
+        scheduled.refresh(provider)
+        if url_changed:
+            self.queue.schedule(provider.id, time.monotonic())
+            self._wake()
+
+    def provider_removed(self, provider_id: int):
+        """A deleted provider: its queued and in-flight results are dropped too"""
+        scheduled = self._untrack(provider_id)
+        if scheduled is not None:
+            scheduled.removed = True
+        (self.buffer or write_buffer).discard(provider_id)
+
+    def _untrack(self, provider_id: int) -> Optional[ScheduledProvider]:
+        """Stop scheduling a provider; results already probed are still written"""
+        self.queue.remove(provider_id)
+        return self._providers.pop(provider_id, None)
+
+    def load(self, rows: Iterable[Tuple[Provider, Optional[ProviderStatus]]], now: Optional[float] = None):
+        """Reconcile the in-memory providers with (provider, status) rows"""
+        now = time.monotonic() if now is None else now
+        self._loaded = True
+        seen = set()
+        for provider, provider_status in rows:
+            if not self._owned(provider.id):
+                continue
+            seen.add(provider.id)
+            scheduled = self._providers.get(provider.id)
+            if scheduled is None:
+                scheduled = self._providers[provider.id] = ScheduledProvider(provider, provider_status)
+                self._schedule_first(scheduled, now)
+            elif scheduled.url != provider.url:
+                scheduled.refresh(provider)
+                self.queue.schedule(provider.id, now)
+            else:
+                scheduled.refresh(provider)
+
+        # Deleted elsewhere or handed to another worker. Buffered results are
+        # kept: write_results() drops those of providers that no longer exist
+        for provider_id in [provider_id for provider_id in self._providers if provider_id not in seen]:
+            self._untrack(provider_id)
+
+    async def resync(self):
+        """Reload every provider from the database"""
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                select(Provider, ProviderStatus).outerjoin(
+                    ProviderStatus, ProviderStatus.provider_id == Provider.id
+                )
+            )).all()
+        self.load(rows)
+        self._signature = (
+            len(rows),
+            max((provider.id for provider, _ in rows), default=None),
+            max((provider.updated_at for provider, _ in rows if provider.updated_at), default=None)
+        )
+        self._last_sync = self._last_poll = time.monotonic()
+
+    async def _poll_changes(self):
+        """Reload if providers were added, edited or deleted since the last reload"""
+        async with self.session_factory() as db:
+            signature = tuple((await db.execute(
+                select(func.count(Provider.id), func.max(Provider.id), func.max(Provider.updated_at))
+            )).one())
+        self._last_poll = time.monotonic()
+        if signature != self._signature:
+            await self.resync()
+
+    def take_due(self, now: float, limit: Optional[int] = None) -> List[ScheduledProvider]:
+        """Pop the providers that are due; they are not in the queue until rescheduled"""
+        return [self._providers[provider_id] for provider_id in self.queue.pop_due(now, limit)]
+
+    def reschedule(self, checked: List[ScheduledProvider], results: Dict[int, dict], now: float):
+        for scheduled in checked:
+            scheduled.record(results[scheduled.id]["status"] == "online")
+            # Deleted while being checked, or already rescheduled by an update
+            if self._providers.get(scheduled.id) is not scheduled or scheduled.id in self.queue:
+                continue
+            self.queue.schedule(scheduled.id, now + _jittered(scheduled.interval()))
+
+    async def _check(self, due: List[ScheduledProvider]):
+        try:
+            results = await check_providers(due, self.sweeper, self.buffer, flush=False)
+        except Exception as e:
+            print(f"Error in scheduled health check: {e}")
+            results = {scheduled.id: {"status": "offline"} for scheduled in due}
+        self.reschedule(due, results, time.monotonic())
+
+        online = sum(1 for result in results.values() if result["status"] == "online")
+        print(f"Health checks: {len(due)} due ({online} online, {len(due) - online} offline), {len(self)} tracked")
+
+    async def run(self):
+        """Dispatch due providers until cancelled"""
+        while True:
+            now = time.monotonic()
+            try:
+                if now - self._last_sync >= HEALTH_CHECK_RESYNC_SECONDS:
+                    await self.resync()
+                elif now - self._last_poll >= HEALTH_CHECK_CHANGE_POLL_SECONDS:
+                    await self._poll_changes()
+            except Exception as e:
+                print(f"Error reloading providers for health checks: {e}")
+                self._last_sync = self._last_poll = now
+            now = time.monotonic()
+
+            # Checks run as their own tasks so a slow provider never holds up the next due one
+            due = self.take_due(now, HEALTH_CHECK_DISPATCH_BATCH)
+            if due:
+                task = asyncio.create_task(self._check(due))
+                self._checks.add(task)
+                task.add_done_callback(self._checks.discard)
+                continue
+
+            next_due = self.queue.peek()
+            timeout = min(
+                self._last_sync + HEALTH_CHECK_RESYNC_SECONDS,
+                self._last_poll + HEALTH_CHECK_CHANGE_POLL_SECONDS
+            ) - now
+            if next_due is not None:
+                timeout = min(timeout, next_due - now)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, timeout))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if not self.running:
+            self._last_sync = self._last_poll = 0.0
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop dispatching and wait for the checks already running"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._checks:
+            await asyncio.gather(*self._checks, return_exceptions=True)
+
+
+check_scheduler = ProviderCheckScheduler()
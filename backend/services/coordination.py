@@ -0,0 +1,130 @@
+import bisect
+import hashlib
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import delete, select
+
+from database import AsyncSessionLocal
+from models import WorkerLease
+
+load_dotenv()
+
+WORKER_COORDINATION_ENABLED = os.getenv("WORKER_COORDINATION_ENABLED", "true").lower() == "true"
+# How often a worker renews its lease...
+WORKER_HEARTBEAT_SECONDS = float(os.getenv("WORKER_HEARTBEAT_SECONDS", "10"))
+# ...and how long a lease lasts without renewal before its providers move elsewhere
+WORKER_LEASE_SECONDS = float(os.getenv("WORKER_LEASE_SECONDS", "30"))
+# Points per worker on the hash ring; more points spread providers more evenly
+HASH_RING_VNODES = int(os.getenv("HASH_RING_VNODES", "64"))
+
+
+def _hash(value: str) -> int:
+    # Python's hash() is salted per process, so every worker would build a different ring
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping provider ids onto worker ids
+
+    Each worker is placed at HASH_RING_VNODES points. When a worker joins or
+    leaves, only the providers between its points and their neighbours move.
+    """
+
+    def __init__(self, worker_ids: List[str], vnodes: int = HASH_RING_VNODES):
+        self.worker_ids = sorted(worker_ids)
+        points = sorted(
+            (_hash(f"{worker_id}#{vnode}"), worker_id)
+            for worker_id in self.worker_ids
+            for vnode in range(max(1, vnodes))
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [worker_id for _, worker_id in points]
+
+    def owner(self, provider_id: int) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(str(provider_id))) % len(self._hashes)
+        return self._owners[index]
+
+
+class WorkerCoordinator:
+    """
+    Shares health checks between the worker processes using one database
+
+    Every worker holds a row in worker_leases and renews it from heartbeat().
+    Live workers (unexpired leases) form a HashRing and each worker checks
+    only the providers the ring gives it. When a worker stops, its lease is
+    deleted; when it dies, the lease expires after WORKER_LEASE_SECONDS.
+    Either way the others rebalance on their next heartbeat. The live worker
+    with the lowest id is the leader and runs the singleton jobs.
+
+    With coordination disabled this worker owns every provider and leads.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, enabled: bool = WORKER_COORDINATION_ENABLED):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.hostname = socket.gethostname()
+        self.pid = os.getpid()
+        self.worker_id = f"{self.hostname}:{self.pid}:{uuid.uuid4().hex[:8]}"
+        self.ring = HashRing([])
+        self.on_rebalance: Optional[Callable[[], Awaitable[None]]] = None
+
+    @property
+    def workers(self) -> List[str]:
+        return self.ring.worker_ids
+
+    @property
+    def is_leader(self) -> bool:
+        if not self.enabled:
+            return True
+        return bool(self.workers) and self.workers[0] == self.worker_id
+
+    def owns(self, provider_id: int) -> bool:
+        if not self.enabled:
+            return True
+        return self.ring.owner(provider_id) == self.worker_id
+
+    async def heartbeat(self) -> bool:
+        """Renew this worker's lease and refresh the ring; returns True if membership changed"""
+        if not self.enabled:
+            return False
+
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            lease = await db.get(WorkerLease, self.worker_id)
+            if lease is None:
+                lease = WorkerLease(worker_id=self.worker_id, hostname=self.hostname, pid=self.pid, started_at=now)
+                db.add(lease)
+            lease.heartbeat_at = now
+            lease.expires_at = now + timedelta(seconds=WORKER_LEASE_SECONDS)
+            await db.execute(delete(WorkerLease).where(WorkerLease.expires_at < now))
+            await db.commit()
+
+            worker_ids = list(await db.scalars(select(WorkerLease.worker_id)))
+
+        if sorted(worker_ids) == self.workers:
+            return False
+
+        self.ring = HashRing(worker_ids)
+        print(f"Workers changed: {len(worker_ids)} live, this worker {'leads' if self.is_leader else 'follows'}")
+        if self.on_rebalance is not None:
+            await self.on_rebalance()
+        return True
+
+    async def release(self):
+        """Give up this worker's lease so the others take over right away"""
+        if not self.enabled:
+            return
+        async with self.session_factory() as db:
+            await db.execute(delete(WorkerLease).where(WorkerLease.worker_id == self.worker_id))
+            await db.commit()
+        self.ring = HashRing([])
+
+
+coordinator = WorkerCoordinator()
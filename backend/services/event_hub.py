@@ -0,0 +1,92 @@
+import asyncio
+import os
+from typing import Dict, Iterable, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Events a slow subscriber may fall behind by before it is told to resync
+EVENT_STREAM_QUEUE_SIZE = int(os.getenv("EVENT_STREAM_QUEUE_SIZE", "1000"))
+
+
+class Subscription:
+    """One connected stream: a bounded queue of (event, data) for one user"""
+
+    def __init__(self, user_id: int, max_size: int = EVENT_STREAM_QUEUE_SIZE):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_size))
+        self.overflowed = False
+
+    def put(self, event: str, data: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait((event, data))
+        except asyncio.QueueFull:
+            # Deltas were lost; the stream sends "resync" and the client reloads
+            self.overflowed = True
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Tuple[str, dict]]:
+        """Next (event, data), or None if nothing arrived within the timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    """
+    In-process publish/subscribe for per-user change events
+
+    Publishers call publish() after their changes are committed; every
+    stream of that user gets a copy. Publishing never blocks: a subscriber
+    whose queue is full is marked as overflowed instead.
+
+    When health checks are written by another process, the event relay
+    publishes changes it reads back from the database and sets relayed, so
+    writers in this process stop building events of their own.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self.published = 0
+        self.relayed = False
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def wants_write_events(self) -> bool:
+        """Whether health check writers in this process should build change events"""
+        return bool(self._subscribers) and not self.relayed
+
+    def publish(self, user_id: int, event: str, data: dict):
+        for subscription in self._subscribers.get(user_id, ()):
+            subscription.put(event, data)
+        self.published += 1
+
+    def publish_all(self, events: Iterable[Tuple[int, str, dict]]):
+        for user_id, event, data in events:
+            self.publish(user_id, event, data)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscribers),
+            "subscriptions": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "published": self.published
+        }
+
+
+event_hub = EventHub()
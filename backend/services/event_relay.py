@@ -0,0 +1,121 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models import Provider, ProviderStatus, Alert
+from services.event_hub import EventHub, event_hub
+
+load_dotenv()
+
+# How often the relay reads recent changes...
+EVENT_RELAY_POLL_SECONDS = float(os.getenv("EVENT_RELAY_POLL_SECONDS", "2"))
+# ...and how far back it looks, which must cover the write buffer's delay
+EVENT_RELAY_LOOKBACK_SECONDS = float(os.getenv("EVENT_RELAY_LOOKBACK_SECONDS", "60"))
+
+
+class EventRelay:
+    """
+    Publishes health check changes written by other processes
+
+    Used when the probes run in a separate worker, so nothing in this
+    process sees the writes. Each poll reads the provider status rows and
+    alerts that changed within the lookback window and publishes the ones
+    not seen before, in the same shape write_results() gives them. The
+    window is wider than the poll interval so rows committed late, with an
+    earlier timestamp, are still picked up. Nothing is read while no stream
+    is connected.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        hub: EventHub = event_hub,
+        lookback_seconds: float = EVENT_RELAY_LOOKBACK_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.hub = hub
+        self.lookback = timedelta(seconds=lookback_seconds)
+        self._status_seen: Dict[int, datetime] = {}
+        self._opened_seen: Dict[int, datetime] = {}
+        self._resolved_seen: Dict[int, datetime] = {}
+
+    def _forget_before(self, since: datetime):
+        for seen in (self._status_seen, self._opened_seen, self._resolved_seen):
+            for key in [key for key, at in seen.items() if at < since]:
+                del seen[key]
+
+    async def poll(self) -> int:
+        """Publish the changes since the last poll; returns how many were published"""
+        if not self.hub.has_subscribers():
+            self._status_seen.clear()
+            self._opened_seen.clear()
+            self._resolved_seen.clear()
+            return 0
+
+        since = datetime.utcnow() - self.lookback
+        async with self.session_factory() as db:
+            statuses = (await db.execute(
+                select(ProviderStatus, Provider.user_id, Provider.name).join(
+                    Provider, Provider.id == ProviderStatus.provider_id
+                ).where(ProviderStatus.last_checked_at >= since)
+            )).all()
+            opened = (await db.execute(
+                select(Alert, Provider.user_id, Provider.name).join(
+                    Provider, Provider.id == Alert.provider_id
+                ).where(Alert.created_at >= since)
+            )).all()
+            resolved = (await db.execute(
+                select(Alert, Provider.user_id, Provider.name).join(
+                    Provider, Provider.id == Alert.provider_id
+                ).where(Alert.resolved_at >= since)
+            )).all()
+
+        events: List[tuple] = []
+        for alert, user_id, provider_name in opened:
+            if alert.id in self._opened_seen:
+                continue
+            self._opened_seen[alert.id] = alert.created_at
+            events.append((user_id, "alert_opened", {
+                "id": alert.id,
+                "provider_id": alert.provider_id,
+                "provider_name": provider_name,
+                "severity": alert.severity,
+                "message": alert.message,
+                "created_at": alert.created_at,
+                "resolved": alert.resolved,
+                "resolved_at": alert.resolved_at
+            }))
+        for alert, user_id, provider_name in resolved:
+            if alert.id in self._resolved_seen:
+                continue
+            self._resolved_seen[alert.id] = alert.resolved_at
+            events.append((user_id, "alert_resolved", {
+                "id": alert.id,
+                "provider_id": alert.provider_id,
+                "provider_name": provider_name,
+                "resolved_at": alert.resolved_at
+            }))
+        for row, user_id, provider_name in statuses:
+            if self._status_seen.get(row.provider_id) == row.last_checked_at:
+                continue
+            self._status_seen[row.provider_id] = row.last_checked_at
+            events.append((user_id, "provider_status", {
+                "provider_id": row.provider_id,
+                "provider_name": provider_name,
+                "status": row.last_status,
+                "response_time_ms": row.last_response_time_ms,
+                "error_message": row.last_error,
+                "last_checked": row.last_checked_at,
+                "consecutive_failures": row.consecutive_failures,
+                "uptime": row.uptime
+            }))
+
+        self._forget_before(since)
+        self.hub.publish_all(events)
+        return len(events)
+
+
+event_relay = EventRelay()
@@ -0,0 +1,108 @@
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Optional, Sequence
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models import HealthCheck
+
+load_dotenv()
+
+# Rows fetched from the database cursor per chunk of output
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_COLUMNS = ("id", "provider_id", "status", "response_time_ms", "error_message", "checked_at")
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _ndjson_chunk(rows: Iterable[Sequence]) -> str:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, map(_value, row)))) + "\n"
+        for row in rows
+    )
+
+
+def _csv_chunk(rows: Iterable[Sequence], header: bool = False) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows([_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+async def stream_health_checks(
+    provider_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[Sequence]:
+    """
+    Yield a provider's health checks in time order, a batch at a time
+
+    Rows come from a server-side cursor with yield_per, so only one batch
+    is held in memory however long the range is. The cursor keeps its own
+    session and connection open until the iteration ends.
+    """
+    statement = select(
+        HealthCheck.id,
+        HealthCheck.provider_id,
+        HealthCheck.status,
+        HealthCheck.response_time_ms,
+        HealthCheck.error_message,
+        HealthCheck.checked_at
+    ).where(HealthCheck.provider_id == provider_id)
+    if start is not None:
+        statement = statement.where(HealthCheck.checked_at >= start)
+    if end is not None:
+        statement = statement.where(HealthCheck.checked_at < end)
+    statement = statement.order_by(HealthCheck.checked_at, HealthCheck.id).execution_options(yield_per=batch_size)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(statement)
+        async for batch in result.partitions():
+            yield batch
+
+
+async def export_health_checks(
+    provider_id: int,
+    export_format: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    compress: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Encode a provider's health checks as NDJSON or CSV, one chunk per batch
+
+    With compress=True the output is a single gzip stream.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    header = export_format == "csv"
+
+    def encode(text: str) -> bytes:
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    if header:
+        yield encode(_csv_chunk([], header=True))
+
+    async for batch in stream_health_checks(provider_id, start, end):
+        chunk = encode(_csv_chunk(batch) if export_format == "csv" else _ndjson_chunk(batch))
+        if chunk:
+            yield chunk
+
+    if compressor:
+        yield compressor.flush()
@@ -1,75 +1,182 @@
+import asyncio
 import httpx
+import os
 import time
+from collections import defaultdict
 from datetime import datetime
-from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
 
-from models import Provider, HealthCheck, Alert
+from models import Provider, HealthCheck
+from services.capabilities import provider_capabilities
+from services.http_client import get_http_client
+from services.event_hub import event_hub
+from services.write_buffer import HealthCheckWriteBuffer, write_buffer, write_results
 
+load_dotenv()
 
-async def check_provider_health(provider: Provider, db: Session) -> HealthCheck:
+# Upper bound on probes in flight across the whole sweep
+MAX_CONCURRENT_CHECKS = int(os.getenv("HEALTH_CHECK_MAX_CONCURRENCY", "50"))
+# Upper bound on probes in flight against a single host
+MAX_CHECKS_PER_HOST = int(os.getenv("HEALTH_CHECK_MAX_PER_HOST", "4"))
+
+
+# Try BlockDAG-specific methods first, then fallback to generic methods
+PROBE_METHODS = [
+    "getBlockCount",      # BlockDAG method
+    "getInfo",            # BlockDAG method
+    "eth_blockNumber",    # Ethereum fallback
+    "net_version"         # Generic fallback
+]
+
+# Endpoints that answered a batch with something other than a batch
+_batch_unsupported = set()
+
+# httpcore trace events that open a new connection
+_CONNECT_EVENTS = ("connection.connect_tcp", "connection.connect_unix_socket", "connection.start_tls")
+
+
+class _ConnectTimer:
     """
-    Check the health of an RPC provider by making a test request
+    httpx trace callback adding up the time spent opening connections
+
+    Probes are minutes apart, longer than servers keep idle connections, so
+    most probes open a new one; its time is subtracted from the latency.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._started: Dict[str, float] = {}
+
+    async def __call__(self, event_name: str, info: dict):
+        step, _, phase = event_name.rpartition(".")
+        if step not in _CONNECT_EVENTS:
+            return
+        if phase == "started":
+            self._started[step] = time.perf_counter()
+        elif step in self._started:
+            self.seconds += time.perf_counter() - self._started.pop(step)
+
+
+async def _probe_batch(client: httpx.AsyncClient, url: str, timer: Optional[_ConnectTimer] = None) -> Optional[tuple]:
+    """
+    Send every probe method in one JSON-RPC batch
+
+    Returns (status, error_message, working method), or None if the
+    endpoint does not support batches and has to be probed one method at a
+    time.
     """
-    start_time = time.time()
+    payload = [
+        {"jsonrpc": "2.0", "method": method, "params": [], "id": i}
+        for i, method in enumerate(PROBE_METHODS)
+    ]
+    response = await client.post(url, json=payload, extensions={"trace": timer} if timer else None)
+
+    if response.status_code >= 500 or response.status_code == 429:
+        return "offline", f"HTTP {response.status_code}", None
+    try:
+        json_response = response.json()
+    except ValueError:
+        json_response = None
+    if response.status_code != 200 or not isinstance(json_response, list):
+        return None
+
+    # Any method returning a result means the endpoint is alive; the first
+    # one in PROBE_METHODS order is the one remembered for later probes
+    answered = {
+        item.get("id") for item in json_response
+        if isinstance(item, dict) and "result" in item
+    }
+    for i, method in enumerate(PROBE_METHODS):
+        if i in answered:
+            return "online", None, method
+    return "offline", "No supported RPC methods found", None
+
+
+async def _probe_serial(
+    client: httpx.AsyncClient,
+    url: str,
+    methods: List[str],
+    timer: Optional[_ConnectTimer] = None
+) -> tuple:
+    """Try methods one request at a time until one succeeds"""
+    for method in methods:
+        try:
+            payload = {
+                "jsonrpc": "2.0",
+                "method": method,
+                "params": [],
+                "id": 1
+            }
+
+            response = await client.post(url, json=payload, extensions={"trace": timer} if timer else None)
+
+            if response.status_code == 200:
+                # Check if we got a valid JSON-RPC response
+                try:
+                    json_response = response.json()
+                    # If we got a result (not an error), consider it online
+                    if "result" in json_response:
+                        return "online", None, method
+                    elif "error" in json_response and json_response["error"].get("code") == -32601:
+                        # Method not found, try next method
+                        continue
+                except:
+                    # Invalid JSON response
+                    continue
+            else:
+                return "offline", f"HTTP {response.status_code}", None
+        except httpx.TimeoutException:
+            # Try next method, unless this was the last one
+            if method == methods[-1]:
+                raise
+            continue
+        except httpx.ConnectError:
+            # Connection failed, no point trying other methods
+            raise
+
+    # If we tried all methods and none worked
+    return "offline", "No supported RPC methods found", None
+
+
+async def probe_provider(
+    url: str,
+    client: Optional[httpx.AsyncClient] = None,
+    method: Optional[str] = None
+) -> dict:
+    """
+    Probe an RPC endpoint and return the raw result without touching the database
+
+    With a known method the probe is a single request for that method.
+    Otherwise the method is discovered: all probe methods go out as one
+    JSON-RPC batch, or one at a time for endpoints that reject batches.
+    The result's "probe_method" is the method that answered, if any.
+    """
+    client = client or get_http_client()
     status = "offline"
     response_time_ms = None
     error_message = None
-    
+    probe_method = None
+
     try:
-        # Make a simple JSON-RPC request to check if the endpoint is alive
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            # Try BlockDAG-specific methods first, then fallback to generic methods
-            methods_to_try = [
-                "getBlockCount",      # BlockDAG method
-                "getInfo",            # BlockDAG method
-                "eth_blockNumber",    # Ethereum fallback
-                "net_version"         # Generic fallback
-            ]
-            
-            response = None
-            for method in methods_to_try:
-                try:
-                    payload = {
-                        "jsonrpc": "2.0",
-                        "method": method,
-                        "params": [],
-                        "id": 1
-                    }
-                    
-                    response = await client.post(provider.url, json=payload)
-                    end_time = time.time()
-                    response_time_ms = (end_time - start_time) * 1000
-                    
-                    if response.status_code == 200:
-                        # Check if we got a valid JSON-RPC response
-                        try:
-                            json_response = response.json()
-                            # If we got a result (not an error), consider it online
-                            if "result" in json_response:
-                                status = "online"
-                                break
-                            elif "error" in json_response and json_response["error"].get("code") == -32601:
-                                # Method not found, try next method
-                                continue
-                        except:
-                            # Invalid JSON response
-                            continue
-                    else:
-                        status = "offline"
-                        error_message = f"HTTP {response.status_code}"
-                        break
-                except httpx.TimeoutException:
-                    # Try next method
-                    continue
-                except httpx.ConnectError:
-                    # Connection failed, no point trying other methods
-                    raise
-            
-            # If we tried all methods and none worked
-            if status != "online" and not error_message:
-                error_message = "No supported RPC methods found"
-                status = "offline"
-                
+        # Connection setup (DNS, TCP, TLS) is excluded, so timing covers the RPC itself
+        timer = _ConnectTimer()
+        start_time = time.perf_counter()
+        outcome = None
+        if method is not None:
+            outcome = await _probe_serial(client, url, [method], timer)
+        elif url not in _batch_unsupported:
+            outcome = await _probe_batch(client, url, timer)
+            if outcome is None:
+                _batch_unsupported.add(url)
+        if outcome is None:
+            outcome = await _probe_serial(client, url, PROBE_METHODS, timer)
+        response_time_ms = (time.perf_counter() - start_time - timer.seconds) * 1000
+        status, error_message, probe_method = outcome
+
     except httpx.TimeoutException:
         error_message = "Request timeout"
         status = "offline"
@@ -79,60 +186,166 @@ async def check_provider_health(provider: Provider, db: Session) -> HealthCheck:
     except Exception as e:
         error_message = str(e)
         status = "offline"
-    
-    # Create health check record
-    health_check = HealthCheck(
-        provider_id=provider.id,
-        status=status,
-        response_time_ms=response_time_ms,
-        error_message=error_message,
-        checked_at=datetime.utcnow()
+
+    return {
+        "status": status,
+        "response_time_ms": response_time_ms,
+        "error_message": error_message,
+        "checked_at": datetime.utcnow(),
+        "probe_method": probe_method
+    }
+
+
+def _with_capability(provider_id: int, result: dict) -> dict:
+    """Record the probe outcome and attach any capability change to persist"""
+    change = provider_capabilities.observe(provider_id, result)
+    return {**result, "capability": change} if change else result
+
+
+async def check_provider_health(provider: Provider, db: AsyncSession) -> Optional[HealthCheck]:
+    """
+    Check the health of an RPC provider by making a test request
+
+    The result is written immediately rather than buffered, so callers see
+    the new health check as soon as this returns. Returns None if the
+    provider was deleted while it was being probed.
+    """
+    method = provider_capabilities.method_for(
+        provider.id, provider.url, provider.probe_method, provider.chain_family
     )
-    db.add(health_check)
-    
-    # Create alert if provider went offline
-    if status == "offline":
-        # Check if there's already an unresolved alert
-        existing_alert = db.query(Alert).filter(
-            Alert.provider_id == provider.id,
-            Alert.resolved == False,
-            Alert.severity == "error"
-        ).first()
-        
-        if not existing_alert:
-            alert = Alert(
-                provider_id=provider.id,
-                severity="error",
-                message=f"Provider {provider.name} is offline: {error_message}",
-                resolved=False
-            )
-            db.add(alert)
-    else:
-        # Resolve any existing offline alerts
-        unresolved_alerts = db.query(Alert).filter(
-            Alert.provider_id == provider.id,
-            Alert.resolved == False,
-            Alert.severity == "error"
-        ).all()
-        
-        for alert in unresolved_alerts:
-            alert.resolved = True
-            alert.resolved_at = datetime.utcnow()
-    
-    db.commit()
-    db.refresh(health_check)
-    
-    return health_check
-
-
-async def check_all_providers(db: Session):
+    result = _with_capability(provider.id, await probe_provider(provider.url, method=method))
+    entry = {"provider_id": provider.id, "provider_name": provider.name, **result}
+    events = [] if event_hub.wants_write_events() else None
+    health_checks = await db.run_sync(write_results, [entry], True, events)
+    if events:
+        event_hub.publish_all(events)
+    return health_checks[0] if health_checks else None
+
+
+class ProbeSweeper:
     """
-    Check health of all providers in the database
+    Runs probes concurrently, bounded by a global and a per-host in-flight limit
+
+    The limits belong to the sweeper, so concurrent run() calls on the same
+    sweeper share them.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENT_CHECKS,
+        max_per_host: int = MAX_CHECKS_PER_HOST
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_per_host = max(1, max_per_host)
+        self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        self._host_limits = defaultdict(lambda: asyncio.Semaphore(self.max_per_host))
+
+    async def run(self, providers: List[Provider]) -> Dict[int, dict]:
+        """
+        Probe every provider and return the results keyed by provider id
+        """
+        client = get_http_client()
+        global_limit = self._global_limit
+        host_limits = self._host_limits
+
+        # Snapshot what the probes need so no task touches ORM state
+        targets = [
+            (provider.id, provider.url, provider_capabilities.method_for(
+                provider.id, provider.url, provider.probe_method, provider.chain_family
+            ))
+            for provider in providers
+        ]
+
+        async def bounded_probe(url: str, method: Optional[str]) -> dict:
+            # Wait on the host slot first so a busy host doesn't hold global slots
+            async with host_limits[_host_of(url)]:
+                async with global_limit:
+                    return await probe_provider(url, client, method)
+
+        outcomes = await asyncio.gather(
+            *(bounded_probe(url, method) for _, url, method in targets),
+            return_exceptions=True
+        )
+
+        results = {}
+        for (provider_id, _, _), outcome in zip(targets, outcomes):
+            if isinstance(outcome, BaseException):
+                outcome = {
+                    "status": "offline",
+                    "response_time_ms": None,
+                    "error_message": str(outcome),
+                    "checked_at": datetime.utcnow()
+                }
+            results[provider_id] = _with_capability(provider_id, outcome)
+
+        return results
+
+
+def _host_of(url: str) -> str:
+    """Return the host:port a URL points at, used to key per-host limits"""
+    try:
+        return urlsplit(url).netloc.lower() or url
+    except ValueError:
+        return url
+
+
+async def check_providers(
+    providers: List[Provider],
+    sweeper: Optional[ProbeSweeper] = None,
+    buffer: Optional[HealthCheckWriteBuffer] = None,
+    flush: bool = True
+) -> Dict[int, dict]:
+    """
+    Probe the given providers concurrently and write the results in batches
+
+    With flush=False results smaller than a batch stay in the buffer for
+    its time-based flush. Returns the probe results keyed by provider id.
     """
-    providers = db.query(Provider).all()
-    
+    sweeper = sweeper or ProbeSweeper()
+    buffer = buffer or write_buffer
+
+    results = await sweeper.run(providers)
+
     for provider in providers:
-        try:
-            await check_provider_health(provider, db)
-        except Exception as e:
-            print(f"Error checking provider {provider.name}: {e}")
+        # Deleted while its probe was in flight
+        if getattr(provider, "removed", False):
+            continue
+        if buffer.add(provider.id, provider.name, results[provider.id]):
+            await buffer.flush()
+    if flush:
+        await buffer.flush()
+
+    return results
+
+
+async def check_all_providers(
+    db: AsyncSession,
+    sweeper: Optional[ProbeSweeper] = None,
+    buffer: Optional[HealthCheckWriteBuffer] = None
+) -> dict:
+    """
+    Check health of all providers in the database
+
+    All probes run concurrently first and the results are then written in
+    batches, so the sweep takes roughly as long as its slowest probe.
+    """
+    providers = (await db.scalars(select(Provider))).all()
+
+    started = time.perf_counter()
+    results = await check_providers(providers, sweeper, buffer)
+    wall_ms = (time.perf_counter() - started) * 1000
+
+    online = sum(1 for result in results.values() if result["status"] == "online")
+    summary = {
+        "providers": len(providers),
+        "online": online,
+        "offline": len(providers) - online,
+        "wall_ms": round(wall_ms, 1)
+    }
+    print(
+        f"Health sweep: {summary['providers']} providers "
+        f"({summary['online']} online, {summary['offline']} offline) "
+        f"in {summary['wall_ms']}ms"
+    )
+
+    return summary
@@ -0,0 +1,72 @@
+import httpx
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "100"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 support in httpx needs the optional h2 package"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _create_client(http2: bool) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=HTTP_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+        ),
+        http2=http2
+    )
+
+
+def start_http_client() -> httpx.AsyncClient:
+    """
+    Create the shared outbound client for this worker
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = HTTP2_ENABLED and _http2_available()
+        _client = _create_client(http2)
+        print(
+            f"HTTP client started (max {HTTP_MAX_CONNECTIONS} connections, "
+            f"HTTP/2 {'on' if http2 else 'off'})"
+        )
+    return _client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the shared outbound client, creating it on first use
+
+    Scripts that never run the app lifespan still get a pooled client.
+    """
+    if _client is None or _client.is_closed:
+        return start_http_client()
+    return _client
+
+
+async def close_http_client():
+    """
+    Close the shared outbound client and its pooled connections
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        print("HTTP client closed.")
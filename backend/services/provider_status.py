@@ -0,0 +1,113 @@
+import os
+from typing import Iterable, List, Optional
+from sqlalchemy import desc, func, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from models import HealthCheck, ProviderStatus
+
+load_dotenv()
+
+# Rolling uptime is computed over each provider's most recent checks
+ROLLING_UPTIME_WINDOW = int(os.getenv("ROLLING_UPTIME_WINDOW", "100"))
+
+
+def _apply(row: ProviderStatus, status: str, response_time_ms: Optional[float], error_message: Optional[str], checked_at):
+    """Advance a provider's current state by one check"""
+    online = status == "online"
+    outcomes = (row.recent_outcomes or "") + ("1" if online else "0")
+    if len(outcomes) > ROLLING_UPTIME_WINDOW:
+        outcomes = outcomes[-ROLLING_UPTIME_WINDOW:]
+
+    row.last_status = status
+    row.last_response_time_ms = response_time_ms
+    row.last_error = error_message
+    row.last_checked_at = checked_at
+    row.consecutive_failures = 0 if online else (row.consecutive_failures or 0) + 1
+    row.recent_outcomes = outcomes
+    row.recent_online = outcomes.count("1")
+
+
+def apply_status_updates(db: Session, entries: List[dict]) -> int:
+    """
+    Fold a batch of probe results into the provider_status table
+
+    Existing rows are loaded with one primary-key lookup and entries are
+    applied in order. Changes are left for the caller's transaction to commit.
+    Returns the number of providers updated.
+    """
+    if not entries:
+        return 0
+
+    provider_ids = {entry["provider_id"] for entry in entries}
+    rows = {
+        row.provider_id: row
+        for row in db.scalars(
+            select(ProviderStatus).where(ProviderStatus.provider_id.in_(provider_ids))
+        )
+    }
+
+    for entry in entries:
+        row = rows.get(entry["provider_id"])
+        if row is None:
+            row = ProviderStatus(provider_id=entry["provider_id"], consecutive_failures=0, recent_outcomes="")
+            db.add(row)
+            rows[entry["provider_id"]] = row
+        _apply(row, entry["status"], entry["response_time_ms"], entry["error_message"], entry["checked_at"])
+
+    return len(provider_ids)
+
+
+def rebuild_provider_status(db: Session, provider_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute provider_status from each provider's most recent health checks
+
+    Changes are flushed but not committed. Returns the number of providers rebuilt.
+    """
+    ranked = select(
+        HealthCheck.provider_id,
+        HealthCheck.status,
+        HealthCheck.response_time_ms,
+        HealthCheck.error_message,
+        HealthCheck.checked_at,
+        func.row_number().over(
+            partition_by=HealthCheck.provider_id,
+            order_by=desc(HealthCheck.checked_at)
+        ).label("rank")
+    )
+    existing = select(ProviderStatus)
+    if provider_ids is not None:
+        provider_ids = list(provider_ids)
+        ranked = ranked.where(HealthCheck.provider_id.in_(provider_ids))
+        existing = existing.where(ProviderStatus.provider_id.in_(provider_ids))
+    ranked = ranked.subquery()
+
+    for row in db.scalars(existing):
+        db.delete(row)
+    db.flush()
+
+    # Oldest first, so replaying the checks leaves the newest as current state
+    checks = db.execute(
+        select(
+            ranked.c.provider_id,
+            ranked.c.status,
+            ranked.c.response_time_ms,
+            ranked.c.error_message,
+            ranked.c.checked_at
+        ).where(
+            ranked.c.rank <= ROLLING_UPTIME_WINDOW
+        ).order_by(ranked.c.provider_id, desc(ranked.c.rank))
+    ).all()
+
+    rows = {}
+    for provider_id, status, response_time_ms, error_message, checked_at in checks:
+        row = rows.get(provider_id)
+        if row is None:
+            row = ProviderStatus(provider_id=provider_id, consecutive_failures=0, recent_outcomes="")
+            rows[provider_id] = row
+        _apply(row, status, response_time_ms, error_message, checked_at)
+
+    db.add_all(rows.values())
+    db.flush()
+
+    return len(rows)
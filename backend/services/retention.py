@@ -0,0 +1,146 @@
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from database import engine
+from models import HealthCheck, HealthCheckRollup, Alert
+from services.archive import archive_before, archive_enabled
+from services.rollups import bucket_start, rebuild_rollups
+
+load_dotenv()
+
+# Raw health checks older than this are deleted once covered by day rollups,
+# after being moved to the columnar archive when it is enabled
+RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "30"))
+# Resolved alerts older than this are deleted
+RETENTION_ALERT_DAYS = int(os.getenv("RETENTION_ALERT_DAYS", "90"))
+# Fine-grained rollups are pruned too; day rollups are kept forever
+RETENTION_MINUTE_ROLLUP_DAYS = int(os.getenv("RETENTION_MINUTE_ROLLUP_DAYS", "7"))
+RETENTION_HOUR_ROLLUP_DAYS = int(os.getenv("RETENTION_HOUR_ROLLUP_DAYS", "90"))
+# Rows deleted per transaction, and the pause between transactions
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.05"))
+
+
+def _delete_in_batches(db: Session, model, *criteria) -> int:
+    """
+    Delete matching rows a batch at a time, committing after each batch so
+    writers are never locked out for long
+    """
+    deleted = 0
+    while True:
+        # No ORDER BY, so the planner can answer this from an index on the criteria
+        ids = db.scalars(
+            select(model.id).where(*criteria).limit(RETENTION_BATCH_SIZE)
+        ).all()
+        if not ids:
+            break
+        db.execute(
+            delete(model).where(model.id.in_(ids)),
+            execution_options={"synchronize_session": False}
+        )
+        db.commit()
+        deleted += len(ids)
+        if len(ids) < RETENTION_BATCH_SIZE:
+            break
+        time.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+    return deleted
+
+
+def ensure_downsampled(db: Session, cutoff: datetime) -> int:
+    """
+    Make sure every provider-day before the cutoff is fully covered by its
+    day rollup, rebuilding the rollups of any day that is not
+
+    Returns the number of provider-days that had to be rebuilt.
+    """
+    day = func.date(HealthCheck.checked_at)
+    raw_counts = db.execute(
+        select(HealthCheck.provider_id, day, func.count(HealthCheck.id))
+        .where(HealthCheck.checked_at < cutoff)
+        .group_by(HealthCheck.provider_id, day)
+    ).all()
+    if not raw_counts:
+        return 0
+
+    rolled_up = {
+        (provider_id, bucket.strftime("%Y-%m-%d")): check_count
+        for provider_id, bucket, check_count in db.execute(
+            select(
+                HealthCheckRollup.provider_id,
+                HealthCheckRollup.bucket_start,
+                HealthCheckRollup.check_count
+            ).where(
+                HealthCheckRollup.granularity == "day",
+                HealthCheckRollup.bucket_start < cutoff
+            )
+        )
+    }
+
+    rebuilt = 0
+    for provider_id, raw_day, raw_count in raw_counts:
+        raw_day = str(raw_day)
+        # A previous run may already have deleted part of the day, so only a
+        # rollup that counts fewer checks than are still stored is missing data
+        if rolled_up.get((provider_id, raw_day), 0) >= raw_count:
+            continue
+        start = datetime.strptime(raw_day, "%Y-%m-%d")
+        rebuild_rollups(db, start=start, end=start + timedelta(days=1), provider_id=provider_id)
+        rebuilt += 1
+
+    return rebuilt
+
+
+def run_retention(db: Session) -> dict:
+    """
+    Apply the retention policy to health checks, alerts and rollups
+    """
+    today = bucket_start(datetime.utcnow(), "day")
+
+    # Only whole days are deleted, so a day's rollup is never compared
+    # against a partially deleted day it was not built from
+    raw_cutoff = today - timedelta(days=RETENTION_RAW_DAYS)
+    rebuilt_days = ensure_downsampled(db, raw_cutoff)
+    archive_summary = archive_before(db, raw_cutoff) if archive_enabled() else {}
+    checks_deleted = _delete_in_batches(db, HealthCheck, HealthCheck.checked_at < raw_cutoff)
+
+    alerts_deleted = _delete_in_batches(
+        db, Alert,
+        Alert.resolved == True,
+        Alert.resolved_at < today - timedelta(days=RETENTION_ALERT_DAYS)
+    )
+
+    rollups_deleted = _delete_in_batches(
+        db, HealthCheckRollup,
+        HealthCheckRollup.granularity == "minute",
+        HealthCheckRollup.bucket_start < today - timedelta(days=RETENTION_MINUTE_ROLLUP_DAYS)
+    )
+    rollups_deleted += _delete_in_batches(
+        db, HealthCheckRollup,
+        HealthCheckRollup.granularity == "hour",
+        HealthCheckRollup.bucket_start < today - timedelta(days=RETENTION_HOUR_ROLLUP_DAYS)
+    )
+
+    return {
+        "rebuilt_days": rebuilt_days,
+        **archive_summary,
+        "health_checks_deleted": checks_deleted,
+        "alerts_deleted": alerts_deleted,
+        "rollups_deleted": rollups_deleted
+    }
+
+
+def run_maintenance(vacuum: bool = False):
+    """
+    Refresh planner statistics, and optionally reclaim free space
+
+    VACUUM cannot run inside a transaction, so this uses an autocommit
+    connection.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if vacuum:
+            conn.exec_driver_sql("VACUUM")
+        conn.exec_driver_sql("ANALYZE")
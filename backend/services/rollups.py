@@ -0,0 +1,227 @@
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import HealthCheck, HealthCheckRollup
+
+GRANULARITIES = ("minute", "hour", "day")
+
+# Upper bounds (ms) of the latency histogram buckets; one extra overflow bucket follows
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+BACKFILL_BATCH_SIZE = 5000
+
+# INSERT ... ON CONFLICT for the supported databases
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Truncate a timestamp to the start of its bucket"""
+    if granularity == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup granularity: {granularity}")
+
+
+def _latency_bucket(latency_ms: float) -> int:
+    for index, upper in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= upper:
+            return index
+    return len(LATENCY_BUCKETS_MS)
+
+
+def estimate_percentile(
+    histogram: List[int],
+    q: float,
+    latency_min: Optional[float],
+    latency_max: Optional[float]
+) -> Optional[float]:
+    """
+    Estimate a latency percentile from a histogram, interpolating linearly
+    inside the bucket that holds it; bucket bounds are clamped to the
+    observed min and max
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    threshold = q * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count and seen + count >= threshold:
+            lower = LATENCY_BUCKETS_MS[index - 1] if index else latency_min
+            upper = LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else latency_max
+            lower = min(max(lower, latency_min), latency_max)
+            upper = max(min(upper, latency_max), lower)
+            return lower + (upper - lower) * (threshold - seen) / count
+        seen += count
+    return latency_max
+
+
+class _Delta:
+    """Aggregate of the checks that fall into one bucket"""
+
+    __slots__ = ("check_count", "online_count", "latencies")
+
+    def __init__(self):
+        self.check_count = 0
+        self.online_count = 0
+        self.latencies = []
+
+
+def _collect(entries: Iterable) -> Dict[Tuple[int, str, datetime], _Delta]:
+    deltas = defaultdict(_Delta)
+    for entry in entries:
+        if isinstance(entry, dict):
+            provider_id = entry["provider_id"]
+            status = entry["status"]
+            latency = entry["response_time_ms"]
+            checked_at = entry["checked_at"]
+        else:
+            provider_id, status, latency, checked_at = entry
+        for granularity in GRANULARITIES:
+            delta = deltas[(provider_id, granularity, bucket_start(checked_at, granularity))]
+            delta.check_count += 1
+            if status == "online":
+                delta.online_count += 1
+            if latency is not None:
+                delta.latencies.append(latency)
+    return deltas
+
+
+def apply_rollups(db: Session, entries: Iterable) -> int:
+    """
+    Fold health checks into their minute, hour and day buckets
+
+    Entries are probe-result dicts or (provider_id, status, response_time_ms,
+    checked_at) tuples. Changes are left in the session for the caller's
+    transaction to commit, so rollups and raw rows are written together.
+    Returns the number of buckets touched.
+
+    Several processes write the same buckets, so missing buckets are
+    created with INSERT ... ON CONFLICT DO NOTHING and the buckets are then
+    read FOR UPDATE, in id order, before being added to. Concurrent writers
+    wait for each other instead of losing counts or failing on the unique
+    constraint. SQLite has no row locks but allows one writer at a time.
+    """
+    deltas = _collect(entries)
+    if not deltas:
+        return 0
+
+    insert = _UPSERT_INSERTS[db.get_bind().dialect.name]
+    db.execute(
+        insert(HealthCheckRollup).on_conflict_do_nothing(
+            index_elements=["provider_id", "granularity", "bucket_start"]
+        ),
+        [
+            {
+                "provider_id": provider_id,
+                "granularity": granularity,
+                "bucket_start": start,
+                "check_count": 0,
+                "online_count": 0,
+                "latency_count": 0,
+                "latency_sum": 0.0
+            }
+            for provider_id, granularity, start in sorted(deltas)
+        ]
+    )
+
+    provider_ids = {key[0] for key in deltas}
+    starts = {key[2] for key in deltas}
+    existing = {
+        (row.provider_id, row.granularity, row.bucket_start): row
+        for row in db.scalars(
+            select(HealthCheckRollup).where(
+                HealthCheckRollup.provider_id.in_(provider_ids),
+                HealthCheckRollup.bucket_start.in_(starts)
+            ).order_by(HealthCheckRollup.id).with_for_update().execution_options(populate_existing=True)
+        )
+    }
+
+    for key, delta in deltas.items():
+        row = existing[key]
+        histogram = json.loads(row.latency_histogram) if row.latency_histogram else [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for latency in delta.latencies:
+            histogram[_latency_bucket(latency)] += 1
+
+        row.check_count += delta.check_count
+        row.online_count += delta.online_count
+        if delta.latencies:
+            row.latency_count += len(delta.latencies)
+            row.latency_sum += sum(delta.latencies)
+            low, high = min(delta.latencies), max(delta.latencies)
+            row.latency_min = low if row.latency_min is None else min(row.latency_min, low)
+            row.latency_max = high if row.latency_max is None else max(row.latency_max, high)
+            row.latency_histogram = json.dumps(histogram)
+            row.latency_p95 = estimate_percentile(histogram, 0.95, row.latency_min, row.latency_max)
+
+    return len(deltas)
+
+
+def rebuild_rollups(
+    db: Session,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    provider_id: Optional[int] = None
+) -> int:
+    """
+    Recompute rollups from raw health checks, committing in batches
+
+    The range is widened to whole days so every touched bucket is rebuilt
+    from scratch. Once retention has deleted a day's raw checks its rollups
+    are the only record of it, so for each provider only the buckets from
+    its oldest remaining raw day onwards are cleared; older ones are kept.
+    Returns the number of health checks folded in.
+    """
+    if start is not None:
+        start = bucket_start(start, "day")
+    if end is not None and end != bucket_start(end, "day"):
+        end = bucket_start(end, "day") + timedelta(days=1)
+
+    clear = delete(HealthCheckRollup)
+    first_raw = select(HealthCheck.provider_id, func.min(HealthCheck.checked_at)).group_by(HealthCheck.provider_id)
+    checks = select(
+        HealthCheck.id,
+        HealthCheck.provider_id,
+        HealthCheck.status,
+        HealthCheck.response_time_ms,
+        HealthCheck.checked_at
+    ).order_by(HealthCheck.id).limit(BACKFILL_BATCH_SIZE)
+    if start is not None:
+        first_raw = first_raw.where(HealthCheck.checked_at >= start)
+        checks = checks.where(HealthCheck.checked_at >= start)
+    if end is not None:
+        clear = clear.where(HealthCheckRollup.bucket_start < end)
+        first_raw = first_raw.where(HealthCheck.checked_at < end)
+        checks = checks.where(HealthCheck.checked_at < end)
+    if provider_id is not None:
+        first_raw = first_raw.where(HealthCheck.provider_id == provider_id)
+        checks = checks.where(HealthCheck.provider_id == provider_id)
+
+    for rolled_provider_id, first_checked_at in db.execute(first_raw).all():
+        db.execute(clear.where(
+            HealthCheckRollup.provider_id == rolled_provider_id,
+            HealthCheckRollup.bucket_start >= bucket_start(first_checked_at, "day")
+        ))
+
+    # Walk the raw rows in id order, one committed batch at a time
+    total = 0
+    last_id = 0
+    while True:
+        batch = db.execute(checks.where(HealthCheck.id > last_id)).all()
+        if not batch:
+            break
+        apply_rollups(db, (row[1:] for row in batch))
+        db.commit()
+        total += len(batch)
+        last_id = batch[-1].id
+    db.commit()
+
+    return total
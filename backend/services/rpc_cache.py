@@ -0,0 +1,201 @@
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+from services.ttl_cache import TTLCache
+
+load_dotenv()
+
+RPC_CACHE_ENABLED = os.getenv("RPC_CACHE_ENABLED", "true").lower() == "true"
+RPC_CACHE_MAX_ENTRIES = int(os.getenv("RPC_CACHE_MAX_ENTRIES", "10000"))
+# Results larger than this are passed through without being cached
+RPC_CACHE_MAX_RESULT_BYTES = int(os.getenv("RPC_CACHE_MAX_RESULT_BYTES", "262144"))
+RPC_CACHE_IMMUTABLE_TTL_SECONDS = float(os.getenv("RPC_CACHE_IMMUTABLE_TTL_SECONDS", "3600"))
+RPC_CACHE_HEAD_TTL_SECONDS = float(os.getenv("RPC_CACHE_HEAD_TTL_SECONDS", "2"))
+# Blocks this far below the last seen head are treated as final
+RPC_CACHE_CONFIRMATIONS = int(os.getenv("RPC_CACHE_CONFIRMATIONS", "12"))
+
+# Results that never change for the same params
+IMMUTABLE_METHODS = {
+    "eth_chainId",
+    "net_version",
+    "eth_getBlockByHash",
+    "eth_getBlockTransactionCountByHash",
+    "eth_getTransactionByBlockHashAndIndex",
+    "eth_getUncleByBlockHashAndIndex",
+    "dag_getBlockByHash",
+}
+
+# Lookups by transaction hash: a reorg can move the transaction to another
+# block until its block is RPC_CACHE_CONFIRMATIONS deep
+CONFIRMED_METHODS = {
+    "eth_getTransactionByHash",
+    "eth_getTransactionReceipt",
+}
+
+# Raw hex results never change, but verbose ones carry confirmations and
+# nextblockhash, which move with the head
+VERBOSE_METHODS = {
+    "getBlock",
+    "getblock",
+    "getrawtransaction",
+}
+
+# Results that change with every new block
+HEAD_METHODS = {
+    "eth_blockNumber",
+    "eth_gasPrice",
+    "eth_maxPriorityFeePerGas",
+    "eth_feeHistory",
+    "getBlockCount",
+    "getblockcount",
+    "getBlockHeight",
+}
+
+# Methods whose result is a block height, used to track the head
+HEIGHT_METHODS = {"eth_blockNumber", "getBlockCount", "getblockcount", "getBlockHeight"}
+
+# Methods that take a block number or tag, and the position of that param
+BLOCK_PARAM_METHODS = {
+    "eth_getBlockByNumber": 0,
+    "eth_getBlockTransactionCountByNumber": 0,
+    "eth_getTransactionByBlockNumberAndIndex": 0,
+    "eth_getBalance": 1,
+    "eth_getCode": 1,
+    "eth_getTransactionCount": 1,
+    "eth_call": 1,
+    "eth_getStorageAt": 2,
+}
+
+
+def _parse_height(value: Any) -> Optional[int]:
+    try:
+        if isinstance(value, str):
+            return int(value, 16) if value.startswith("0x") else int(value)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    except ValueError:
+        pass
+    return None
+
+
+class RpcResponseCache:
+    """
+    Caches successful JSON-RPC results for the proxy
+
+    Immutable lookups (by block hash, or by a block number at least
+    RPC_CACHE_CONFIRMATIONS below the head) are kept for
+    RPC_CACHE_IMMUTABLE_TTL_SECONDS. Head-dependent calls are kept for
+    RPC_CACHE_HEAD_TTL_SECONDS and keyed on the last block height seen for
+    the group, so a new block makes their entries unreachable. Transaction
+    lookups by hash and BlockDAG block and transaction lookups start out
+    head-dependent, and are stored as immutable once the result is final: a
+    transaction in a block that deep, or a raw hex result. Errors, null
+    results and pending objects are never cached.
+    """
+
+    def __init__(self, max_entries: int = RPC_CACHE_MAX_ENTRIES):
+        self.entries = TTLCache(max_entries, RPC_CACHE_IMMUTABLE_TTL_SECONDS)
+        self._heads: Dict[Tuple[int, str], int] = {}
+
+    def head(self, user_id: int, group: str) -> Optional[int]:
+        return self._heads.get((user_id, group))
+
+    def _ttl_for(self, user_id: int, group: str, method: str, params: list) -> Optional[float]:
+        """Return how long a result may be cached, or None if it must not be"""
+        if method in IMMUTABLE_METHODS:
+            return RPC_CACHE_IMMUTABLE_TTL_SECONDS
+        if method in HEAD_METHODS or method in CONFIRMED_METHODS or method in VERBOSE_METHODS:
+            return RPC_CACHE_HEAD_TTL_SECONDS
+        if method in BLOCK_PARAM_METHODS:
+            index = BLOCK_PARAM_METHODS[method]
+            tag = params[index] if index < len(params) else "latest"
+            if tag == "pending":
+                return None
+            if tag == "earliest":
+                return RPC_CACHE_IMMUTABLE_TTL_SECONDS
+            number = _parse_height(tag) if isinstance(tag, str) and tag.startswith("0x") else None
+            head = self.head(user_id, group)
+            if number is not None and head is not None and number <= head - RPC_CACHE_CONFIRMATIONS:
+                return RPC_CACHE_IMMUTABLE_TTL_SECONDS
+            return RPC_CACHE_HEAD_TTL_SECONDS
+        return None
+
+    def key_for(self, user_id: int, group: str, payload: Any) -> Optional[tuple]:
+        """Cache key for a single JSON-RPC request, or None if it is not cacheable"""
+        if not RPC_CACHE_ENABLED or not isinstance(payload, dict):
+            return None
+        method = payload.get("method")
+        params = payload.get("params", [])
+        if not isinstance(method, str) or not isinstance(params, list):
+            return None
+        ttl = self._ttl_for(user_id, group, method, params)
+        if ttl is None:
+            return None
+        canonical_params = json.dumps(params, sort_keys=True, separators=(",", ":"))
+        if method in CONFIRMED_METHODS or method in VERBOSE_METHODS:
+            final_key = (user_id, group, method, canonical_params, None, RPC_CACHE_IMMUTABLE_TTL_SECONDS)
+            if final_key in self.entries:
+                return final_key
+        # Head-dependent entries are only reachable until the head moves
+        head = None if ttl == RPC_CACHE_IMMUTABLE_TTL_SECONDS else self.head(user_id, group)
+        return (user_id, group, method, canonical_params, head, ttl)
+
+    def _is_final(self, user_id: int, group: str, method: str, result: Any) -> bool:
+        """Whether a head-dependent lookup returned a result that can no longer change"""
+        if method in VERBOSE_METHODS:
+            return isinstance(result, str)
+        if method in CONFIRMED_METHODS and isinstance(result, dict):
+            number = _parse_height(result.get("blockNumber"))
+            head = self.head(user_id, group)
+            return number is not None and head is not None and number <= head - RPC_CACHE_CONFIRMATIONS
+        return False
+
+    def get_response(self, key: tuple, request_id: Any) -> Optional[dict]:
+        """Return a cached JSON-RPC response object carrying the caller's request id"""
+        result = self.entries.get(key)
+        if result is None:
+            return None
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def get(self, key: tuple, request_id: Any) -> Optional[bytes]:
+        """Return a cached response body carrying the caller's request id"""
+        response = self.get_response(key, request_id)
+        return json.dumps(response).encode() if response is not None else None
+
+    def store(self, key: tuple, content: bytes):
+        """Cache the result in an upstream response body and track the head"""
+        user_id, group, method = key[0], key[1], key[2]
+        try:
+            response = json.loads(content)
+        except ValueError:
+            return
+        if not isinstance(response, dict) or "error" in response:
+            return
+        result = response.get("result")
+        if result is None:
+            return
+
+        if method in HEIGHT_METHODS:
+            height = _parse_height(result)
+            if height is not None and height > self._heads.get((user_id, group), -1):
+                self._heads[(user_id, group)] = height
+                key = key[:4] + (height,) + key[5:]
+
+        # Transactions and receipts are pending until they have a block
+        if isinstance(result, dict) and any(
+            field in result and result[field] is None for field in ("blockHash", "blockNumber")
+        ):
+            return
+        if len(content) > RPC_CACHE_MAX_RESULT_BYTES:
+            return
+        if self._is_final(user_id, group, method, result):
+            key = key[:4] + (None, RPC_CACHE_IMMUTABLE_TTL_SECONDS)
+        self.entries.set(key, result, ttl_seconds=key[-1])
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+
+rpc_response_cache = RpcResponseCache()
@@ -0,0 +1,260 @@
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+import httpx
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Provider, ProviderStatus
+from services.http_client import get_http_client
+from services.rpc_cache import (
+    BLOCK_PARAM_METHODS,
+    CONFIRMED_METHODS,
+    HEAD_METHODS,
+    IMMUTABLE_METHODS,
+    VERBOSE_METHODS,
+)
+from services.single_flight import SingleFlight
+from services.ttl_cache import TTLCache
+
+load_dotenv()
+
+RPC_PROXY_TIMEOUT_SECONDS = float(os.getenv("RPC_PROXY_TIMEOUT_SECONDS", "10"))
+# Providers tried per request before giving up
+RPC_PROXY_MAX_ATTEMPTS = int(os.getenv("RPC_PROXY_MAX_ATTEMPTS", "3"))
+RPC_PROXY_MAX_BATCH_SIZE = int(os.getenv("RPC_PROXY_MAX_BATCH_SIZE", "100"))
+# A provider that fails a proxied request is skipped for this long
+RPC_PROXY_FAILURE_COOLDOWN_SECONDS = float(os.getenv("RPC_PROXY_FAILURE_COOLDOWN_SECONDS", "30"))
+RPC_ROUTE_CACHE_TTL_SECONDS = float(os.getenv("RPC_ROUTE_CACHE_TTL_SECONDS", "10"))
+RPC_ROUTE_CACHE_MAX_ENTRIES = int(os.getenv("RPC_ROUTE_CACHE_MAX_ENTRIES", "10000"))
+
+# Weight of the newest sample in the latency moving average
+EWMA_ALPHA = 0.3
+# Latency assumed for a provider that has never been measured once it is busy
+DEFAULT_LATENCY_MS = 500.0
+
+# Read-only methods whose answer is the same for every caller, so identical
+# concurrent calls can share one upstream request. Anything else, including
+# unknown methods, transaction submissions and filter or subscription calls
+# such as eth_getFilterChanges, is always sent upstream on its own.
+COALESCED_METHODS = (
+    IMMUTABLE_METHODS
+    | CONFIRMED_METHODS
+    | VERBOSE_METHODS
+    | HEAD_METHODS
+    | set(BLOCK_PARAM_METHODS)
+    | {
+        "eth_estimateGas",
+        "eth_getBlockReceipts",
+        "eth_getLogs",
+        "eth_getProof",
+        "eth_getUncleByBlockNumberAndIndex",
+        "eth_getUncleCountByBlockHash",
+        "eth_getUncleCountByBlockNumber",
+        "eth_protocolVersion",
+        "eth_syncing",
+        "net_listening",
+        "net_peerCount",
+        "web3_clientVersion",
+        "getInfo",
+        "getinfo",
+        "getBlockHash",
+        "getblockhash",
+        "getbestblockhash",
+        "getblockchaininfo",
+        "getdifficulty",
+        "getmempoolinfo",
+    }
+)
+
+
+class NoUpstreamAvailable(Exception):
+    """Every provider tried for a request failed"""
+
+
+class RouteTarget:
+    """A provider behind a proxy group, as last recorded by the health checker"""
+
+    def __init__(self, provider_id: int, name: str, url: str, last_status: Optional[str],
+                 latency_ms: Optional[float]):
+        self.provider_id = provider_id
+        self.name = name
+        self.url = url
+        self.last_status = last_status
+        self.latency_ms = latency_ms
+
+
+class TargetStats:
+    """Live load and latency of one provider as seen by this worker's proxy"""
+
+    def __init__(self, latency_ms: Optional[float]):
+        self.in_flight = 0
+        self.ewma_ms = latency_ms
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def score(self) -> float:
+        if self.ewma_ms is None:
+            # Unmeasured providers win when idle so they get a first sample
+            return 0.0 if self.in_flight == 0 else DEFAULT_LATENCY_MS * (self.in_flight + 1)
+        return self.ewma_ms * (self.in_flight + 1)
+
+    def record_success(self, elapsed_ms: float):
+        if self.ewma_ms is None:
+            self.ewma_ms = elapsed_ms
+        else:
+            self.ewma_ms = EWMA_ALPHA * elapsed_ms + (1 - EWMA_ALPHA) * self.ewma_ms
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+        self.cooldown_until = time.monotonic() + RPC_PROXY_FAILURE_COOLDOWN_SECONDS
+
+
+class ProxyResponse:
+    def __init__(self, status_code: int, content: bytes, target: RouteTarget):
+        self.status_code = status_code
+        self.content = content
+        self.target = target
+
+
+class RpcProxy:
+    """
+    Forwards JSON-RPC requests to the providers of a group
+
+    Targets are picked by power-of-two-choices: two random healthy providers
+    are compared on latency (seeded from provider_status, then a moving
+    average of proxied calls) weighted by requests in flight, and the better
+    one is used. Transport errors, timeouts, 429s and 5xx responses fail
+    over to another provider.
+    """
+
+    def __init__(self):
+        self.routes = TTLCache(RPC_ROUTE_CACHE_MAX_ENTRIES, RPC_ROUTE_CACHE_TTL_SECONDS)
+        self._stats: Dict[int, TargetStats] = {}
+
+    async def get_route(self, db: AsyncSession, user_id: int, group: str) -> List[RouteTarget]:
+        """Providers of a user's group, cached for RPC_ROUTE_CACHE_TTL_SECONDS"""
+        key = (user_id, group)
+        targets = self.routes.get(key)
+        if targets is not None:
+            return targets
+
+        rows = (await db.execute(
+            select(
+                Provider.id,
+                Provider.name,
+                Provider.url,
+                ProviderStatus.last_status,
+                ProviderStatus.last_response_time_ms
+            ).outerjoin(
+                ProviderStatus, ProviderStatus.provider_id == Provider.id
+            ).where(
+                Provider.user_id == user_id,
+                Provider.group_name == group
+            )
+        )).all()
+        targets = [RouteTarget(*row) for row in rows]
+        self.routes.set(key, targets)
+        return targets
+
+    def invalidate_routes(self, user_id: int, *groups: str):
+        for group in groups:
+            self.routes.invalidate((user_id, group))
+
+    def forget_provider(self, provider_id: int):
+        """Drop live stats for a provider that was deleted or moved to a new URL"""
+        self._stats.pop(provider_id, None)
+
+    def _stats_for(self, target: RouteTarget) -> TargetStats:
+        stats = self._stats.get(target.provider_id)
+        if stats is None:
+            stats = self._stats[target.provider_id] = TargetStats(target.latency_ms)
+        return stats
+
+    def _is_healthy(self, target: RouteTarget, now: float) -> bool:
+        return target.last_status != "offline" and self._stats_for(target).cooldown_until <= now
+
+    def choose(self, targets: List[RouteTarget], tried: set) -> Optional[RouteTarget]:
+        """Pick the next provider to try, preferring healthy ones"""
+        now = time.monotonic()
+        untried = [target for target in targets if target.provider_id not in tried]
+        candidates = [target for target in untried if self._is_healthy(target, now)] or untried
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        return first if self._stats_for(first).score() <= self._stats_for(second).score() else second
+
+    async def _send(self, target: RouteTarget, body: bytes) -> Tuple[int, bytes]:
+        response = await get_http_client().post(
+            target.url,
+            content=body,
+            headers={"Content-Type": "application/json"},
+            timeout=RPC_PROXY_TIMEOUT_SECONDS
+        )
+        return response.status_code, response.content
+
+    async def forward(self, targets: List[RouteTarget], body: bytes) -> ProxyResponse:
+        """Send a raw JSON-RPC body to the best provider, failing over on errors"""
+        tried = set()
+        last_error = "no providers in group"
+        for _ in range(min(RPC_PROXY_MAX_ATTEMPTS, len(targets))):
+            target = self.choose(targets, tried)
+            if target is None:
+                break
+            tried.add(target.provider_id)
+
+            stats = self._stats_for(target)
+            stats.in_flight += 1
+            started = time.perf_counter()
+            try:
+                status_code, content = await self._send(target, body)
+            except httpx.HTTPError as e:
+                stats.record_failure()
+                last_error = f"{target.name}: {type(e).__name__}"
+                continue
+            finally:
+                stats.in_flight -= 1
+
+            if status_code == 429 or status_code >= 500:
+                stats.record_failure()
+                last_error = f"{target.name}: HTTP {status_code}"
+                continue
+
+            stats.record_success((time.perf_counter() - started) * 1000)
+            return ProxyResponse(status_code, content, target)
+
+        raise NoUpstreamAvailable(last_error)
+
+
+def coalesce_key(user_id: int, group: str, payload: Any) -> Optional[tuple]:
+    """Key under which identical concurrent requests share one upstream call"""
+    if not isinstance(payload, dict):
+        return None
+    method = payload.get("method")
+    if not isinstance(method, str) or method not in COALESCED_METHODS:
+        return None
+    params = json.dumps(payload.get("params", []), sort_keys=True, separators=(",", ":"))
+    return (user_id, group, method, params)
+
+
+def with_request_id(content: bytes, request_id: Any) -> bytes:
+    """Rewrite a shared response body so it carries another caller's id"""
+    try:
+        response = json.loads(content)
+    except ValueError:
+        return content
+    if not isinstance(response, dict) or response.get("id") == request_id:
+        return content
+    response["id"] = request_id
+    return json.dumps(response).encode()
+
+
+rpc_proxy = RpcProxy()
+rpc_single_flight = SingleFlight()
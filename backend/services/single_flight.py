@@ -0,0 +1,47 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one
+
+    The first caller for a key starts the call as a task; everyone who asks
+    for the same key while it is running awaits that task instead of making
+    their own call. The task is shielded, so a caller that disconnects does
+    not cancel the call for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.collapsed = 0
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return the call's result and whether it was shared with another caller"""
+        task = self._calls.get(key)
+        if task is not None:
+            self.collapsed += 1
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(call())
+        self._calls[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        self.leaders += 1
+        return await asyncio.shield(task), False
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.collapsed
+        return {
+            "in_flight": len(self._calls),
+            "upstream_calls": self.leaders,
+            "collapsed": self.collapsed,
+            "collapse_rate": round(self.collapsed / calls, 4) if calls else 0.0
+        }
@@ -0,0 +1,312 @@
+import asyncio
+import os
+import time
+from typing import Callable, List, Optional
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from database import AsyncSessionLocal
+from models import Provider, ProviderStatus, HealthCheck, Alert
+from services.event_hub import event_hub
+from services.provider_status import apply_status_updates
+from services.rollups import apply_rollups
+
+load_dotenv()
+
+# Flush once this many results are waiting...
+WRITE_BUFFER_MAX_SIZE = int(os.getenv("WRITE_BUFFER_MAX_SIZE", "500"))
+# ...or once the oldest waiting result is this old
+WRITE_BUFFER_MAX_AGE_SECONDS = float(os.getenv("WRITE_BUFFER_MAX_AGE_SECONDS", "5"))
+
+
+def write_results(
+    db: Session,
+    entries: List[dict],
+    returning: bool = False,
+    events: Optional[list] = None
+) -> List[HealthCheck]:
+    """
+    Write a batch of probe results in one transaction
+
+    This is sync ORM code; async callers run it with AsyncSession.run_sync.
+    Each entry is a probe result plus "provider_id" and "provider_name".
+    Health checks go in as one batched insert, new offline alerts as another,
+    and the alerts that were open before the batch are resolved by id, at
+    the time of the check that saw the provider recover.
+    Provider status rows and rollup buckets are updated in the same transaction.
+    Entries are applied in order, so a provider that flaps inside one batch
+    gets the same alert history it would have had with per-check commits.
+    Entries carrying a "capability" change update the provider's
+    probe_method / chain_family. Entries of providers deleted since they
+    were probed are dropped, so a delete is never followed by fresh rows
+    for the old id.
+
+    When an events list is passed, (user_id, event, data) tuples describing
+    the changes are appended to it for the event hub: one "provider_status"
+    per provider with its latest state, plus "alert_opened" and
+    "alert_resolved". They are only valid once the transaction commits.
+    """
+    if not entries:
+        return []
+
+    live = set(db.scalars(
+        select(Provider.id).where(Provider.id.in_({entry["provider_id"] for entry in entries}))
+    ))
+    entries = [entry for entry in entries if entry["provider_id"] in live]
+    if not entries:
+        return []
+
+    provider_ids = {entry["provider_id"] for entry in entries}
+    open_in_db = db.execute(
+        select(Alert.id, Alert.provider_id).where(
+            Alert.provider_id.in_(provider_ids),
+            Alert.resolved == False,
+            Alert.severity == "error"
+        )
+    ).all()
+
+    # Which alert is open per provider: "db", an index into new_alerts, or None
+    open_alert = {provider_id: "db" for _, provider_id in open_in_db}
+    new_alerts = []
+    # When each provider with alerts open before the batch recovered
+    resolve_in_db = {}
+
+    for entry in entries:
+        provider_id = entry["provider_id"]
+        current = open_alert.get(provider_id)
+        if entry["status"] == "offline":
+            if current is None:
+                new_alerts.append({
+                    "provider_id": provider_id,
+                    "severity": "error",
+                    "message": f"Provider {entry['provider_name']} is offline: {entry['error_message']}",
+                    "resolved": False,
+                    "created_at": entry["checked_at"],
+                    "resolved_at": None
+                })
+                open_alert[provider_id] = len(new_alerts) - 1
+        elif current == "db":
+            resolve_in_db[provider_id] = entry["checked_at"]
+            open_alert[provider_id] = None
+        elif current is not None:
+            new_alerts[current]["resolved"] = True
+            new_alerts[current]["resolved_at"] = entry["checked_at"]
+            open_alert[provider_id] = None
+
+    rows = [
+        {
+            "provider_id": entry["provider_id"],
+            "status": entry["status"],
+            "response_time_ms": entry["response_time_ms"],
+            "error_message": entry["error_message"],
+            "checked_at": entry["checked_at"]
+        }
+        for entry in entries
+    ]
+
+    try:
+        if returning:
+            health_checks = list(db.scalars(
+                insert(HealthCheck).returning(HealthCheck, sort_by_parameter_order=True),
+                rows
+            ))
+        else:
+            db.execute(insert(HealthCheck), rows)
+            health_checks = []
+
+        # Only alerts that were open before the batch: an alert opened by a
+        # later entry of the same batch stays open
+        resolved_rows = [
+            (alert_id, provider_id, resolve_in_db[provider_id])
+            for alert_id, provider_id in open_in_db if provider_id in resolve_in_db
+        ]
+        if resolved_rows:
+            db.execute(
+                update(Alert.__table__).where(
+                    Alert.__table__.c.id == bindparam("alert_id"),
+                    Alert.__table__.c.resolved == False
+                ),
+                [
+                    {"alert_id": alert_id, "resolved": True, "resolved_at": resolved_at}
+                    for alert_id, _, resolved_at in resolved_rows
+                ]
+            )
+
+        new_alert_ids = []
+        if new_alerts and events is not None:
+            new_alert_ids = list(db.scalars(
+                insert(Alert).returning(Alert.id, sort_by_parameter_order=True),
+                new_alerts
+            ))
+        elif new_alerts:
+            db.execute(insert(Alert), new_alerts)
+
+        # Later entries for the same provider win
+        capabilities = {
+            entry["provider_id"]: entry["capability"]
+            for entry in entries if entry.get("capability")
+        }
+        if capabilities:
+            db.execute(
+                update(Provider.__table__).where(Provider.__table__.c.id == bindparam("provider_id")),
+                [{"provider_id": provider_id, **change} for provider_id, change in capabilities.items()]
+            )
+
+        apply_status_updates(db, entries)
+        apply_rollups(db, entries)
+
+        if events is not None:
+            events.extend(_change_events(db, entries, new_alerts, new_alert_ids, resolved_rows))
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return health_checks
+
+
+def _change_events(db: Session, entries: List[dict], new_alerts: List[dict],
+                   new_alert_ids: List[int], resolved_rows: list) -> List[tuple]:
+    """Build the event hub deltas for one write_results() batch"""
+    provider_ids = {entry["provider_id"] for entry in entries}
+    owners = dict(db.execute(
+        select(Provider.id, Provider.user_id).where(Provider.id.in_(provider_ids))
+    ).all())
+    names = {entry["provider_id"]: entry["provider_name"] for entry in entries}
+    events = []
+
+    for alert_id, alert in zip(new_alert_ids, new_alerts):
+        events.append((owners.get(alert["provider_id"]), "alert_opened", {
+            "id": alert_id,
+            "provider_id": alert["provider_id"],
+            "provider_name": names[alert["provider_id"]],
+            "severity": alert["severity"],
+            "message": alert["message"],
+            "created_at": alert["created_at"],
+            "resolved": alert["resolved"],
+            "resolved_at": alert["resolved_at"]
+        }))
+    for alert_id, provider_id, resolved_at in resolved_rows:
+        events.append((owners.get(provider_id), "alert_resolved", {
+            "id": alert_id,
+            "provider_id": provider_id,
+            "provider_name": names[provider_id],
+            "resolved_at": resolved_at
+        }))
+
+    # The status rows were just updated in this session; once flushed, get() needs no query
+    db.flush()
+    for provider_id in provider_ids:
+        row = db.get(ProviderStatus, provider_id)
+        if row is None:
+            continue
+        events.append((owners.get(provider_id), "provider_status", {
+            "provider_id": provider_id,
+            "provider_name": names[provider_id],
+            "status": row.last_status,
+            "response_time_ms": row.last_response_time_ms,
+            "error_message": row.last_error,
+            "last_checked": row.last_checked_at,
+            "consecutive_failures": row.consecutive_failures,
+            "uptime": row.uptime
+        }))
+
+    return [event for event in events if event[0] is not None]
+
+
+class HealthCheckWriteBuffer:
+    """
+    Collects probe results and writes them in batches
+
+    A flush is due when the buffer reaches max_size or when the oldest entry
+    is older than max_age_seconds; flush() can also be called explicitly.
+    Flushes are serialized so batches are applied in the order they were
+    collected.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        max_size: int = WRITE_BUFFER_MAX_SIZE,
+        max_age_seconds: float = WRITE_BUFFER_MAX_AGE_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.max_size = max(1, max_size)
+        self.max_age_seconds = max_age_seconds
+        self._entries: List[dict] = []
+        self._oldest: Optional[float] = None
+        self._flush_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, provider_id: int, provider_name: str, result: dict) -> bool:
+        """
+        Queue a probe result
+
+        Returns True when the size or age limit is reached and the caller
+        should flush.
+        """
+        if not self._entries:
+            self._oldest = time.monotonic()
+        self._entries.append({
+            "provider_id": provider_id,
+            "provider_name": provider_name,
+            **result
+        })
+        return self.is_due()
+
+    def discard(self, provider_id: int) -> int:
+        """Drop the queued results of a deleted provider; returns how many"""
+        kept = [entry for entry in self._entries if entry["provider_id"] != provider_id]
+        dropped = len(self._entries) - len(kept)
+        self._entries = kept
+        if not kept:
+            self._oldest = None
+        return dropped
+
+    def is_due(self) -> bool:
+        """Whether the buffer has hit its size or age limit"""
+        if not self._entries:
+            return False
+        if len(self._entries) >= self.max_size:
+            return True
+        return time.monotonic() - self._oldest >= self.max_age_seconds
+
+    async def flush_if_due(self) -> int:
+        """Flush only if the size or age limit has been reached"""
+        return await self.flush() if self.is_due() else 0
+
+    async def flush(self) -> int:
+        """
+        Write everything buffered so far in one transaction
+        """
+        async with self._flush_lock:
+            entries, self._entries = self._entries, []
+            self._oldest = None
+
+            if not entries:
+                return 0
+
+            # Change events are only built while someone is streaming them
+            events = [] if event_hub.wants_write_events() else None
+            try:
+                async with self.session_factory() as db:
+                    await db.run_sync(write_results, entries, False, events)
+            except Exception as e:
+                print(f"Error flushing {len(entries)} health checks: {e}")
+                # Keep the results for the next flush unless the backlog is runaway
+                if len(self._entries) + len(entries) <= self.max_size * 10:
+                    self._entries[:0] = entries
+                    self._oldest = time.monotonic()
+                return 0
+
+            if events:
+                event_hub.publish_all(events)
+            return len(entries)
+
+
+write_buffer = HealthCheckWriteBuffer()
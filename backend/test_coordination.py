@@ -0,0 +1,208 @@
+"""
+Multi-worker coordination check.
+
+Starts several API server processes against one SQLite database, with a
+local fake JSON-RPC endpoint for them to probe, and checks that:
+- every worker holds a lease and the providers are split between them
+- each provider is checked at its normal rate, not once per worker
+- when a worker is killed, the survivors take over its providers once its
+  lease expires
+
+Takes about a minute. Run directly:
+    python test_coordination.py
+"""
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORKERS = int(os.getenv("COORDINATION_TEST_WORKERS", "3"))
+PROVIDERS = int(os.getenv("COORDINATION_TEST_PROVIDERS", "30"))
+CHECK_INTERVAL_SECONDS = 3
+LEASE_SECONDS = 4
+WINDOW_SECONDS = 12
+
+workdir = tempfile.mkdtemp(prefix="rpc-sentinel-coordination-")
+DATABASE_URL = f"sqlite:///{workdir}/coordination.db"
+os.environ["DATABASE_URL"] = DATABASE_URL
+
+from sqlalchemy import func, select  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import User, Provider, HealthCheck, WorkerLease  # noqa: E402
+
+
+class FakeRpcHandler(BaseHTTPRequestHandler):
+    """Answers every JSON-RPC request or batch with a block height"""
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        answer = lambda item: {"jsonrpc": "2.0", "id": item.get("id"), "result": "0x10"}
+        body = json.dumps([answer(item) for item in payload] if isinstance(payload, list) else answer(payload)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_worker(port: int) -> tuple:
+    env = dict(
+        os.environ,
+        DATABASE_URL=DATABASE_URL,
+        PYTHONUNBUFFERED="1",
+        HEALTH_CHECK_INTERVAL_MINUTES=str(CHECK_INTERVAL_SECONDS / 60),
+        HEALTH_CHECK_MIN_INTERVAL_SECONDS="1",
+        HEALTH_CHECK_STABILITY_WINDOW="1000000",
+        HEALTH_CHECK_JITTER="0",
+        HEALTH_CHECK_CHANGE_POLL_SECONDS="1",
+        WORKER_HEARTBEAT_SECONDS="1",
+        WORKER_LEASE_SECONDS=str(LEASE_SECONDS),
+        WRITE_BUFFER_MAX_AGE_SECONDS="1",
+    )
+    log_path = os.path.join(workdir, f"worker-{port}.log")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        env=env,
+        stdout=open(log_path, "w"),
+        stderr=subprocess.STDOUT
+    )
+    return process, log_path
+
+
+def tracked(log_path: str) -> int:
+    """Providers the worker last reported tracking"""
+    with open(log_path) as log:
+        counts = re.findall(r"(\d+) tracked", log.read())
+    return int(counts[-1]) if counts else 0
+
+
+def live_leases() -> int:
+    with SessionLocal() as db:
+        return db.scalar(select(func.count()).select_from(WorkerLease).where(
+            WorkerLease.expires_at >= datetime.utcnow()
+        ))
+
+
+def checks_per_provider(since: datetime) -> dict:
+    with SessionLocal() as db:
+        return dict(db.execute(
+            select(HealthCheck.provider_id, func.count()).where(
+                HealthCheck.checked_at >= since
+            ).group_by(HealthCheck.provider_id)
+        ).all())
+
+
+def wait_for(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def measure_window() -> dict:
+    """Health checks per provider over the next WINDOW_SECONDS"""
+    since = datetime.utcnow()
+    time.sleep(WINDOW_SECONDS)
+    # Let the write buffers flush
+    time.sleep(2)
+    return checks_per_provider(since)
+
+
+def check_window(counts: dict, workers: list):
+    expected = WINDOW_SECONDS / CHECK_INTERVAL_SECONDS
+    missing = PROVIDERS - len(counts)
+    assert not missing, f"{missing} providers were not checked"
+    total = sum(counts.values())
+    # One worker per provider gives about expected checks each; duplicates multiply it
+    assert total <= PROVIDERS * (expected + 1.5), f"{total} checks for {PROVIDERS} providers, expected about {PROVIDERS * expected:.0f}"
+    shares = [tracked(log_path) for _, log_path in workers]
+    assert sum(shares) == PROVIDERS, f"workers track {shares}, expected {PROVIDERS} in total"
+    assert all(shares), f"a worker tracks no providers: {shares}"
+    return total, shares
+
+
+def main() -> int:
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    rpc_server = ThreadingHTTPServer(("127.0.0.1", 0), FakeRpcHandler)
+    threading.Thread(target=rpc_server.serve_forever, daemon=True).start()
+    rpc_url = f"http://127.0.0.1:{rpc_server.server_address[1]}"
+
+    with SessionLocal() as db:
+        user = User(email="coordination@example.com", hashed_password="-")
+        db.add(user)
+        db.flush()
+        db.add_all(Provider(user_id=user.id, name=f"Provider {i}", url=f"{rpc_url}/{i}") for i in range(PROVIDERS))
+        db.commit()
+
+    workers = [start_worker(free_port()) for _ in range(WORKERS)]
+    failed = 0
+    try:
+        def all_leases():
+            assert wait_for(lambda: live_leases() == WORKERS, 30), f"{live_leases()} leases, expected {WORKERS}"
+
+        def shared_checks():
+            counts = measure_window()
+            total, shares = check_window(counts, workers)
+            print(f"   {total} checks in {WINDOW_SECONDS}s, providers per worker {shares}")
+
+        def failover():
+            process, _ = workers.pop()
+            process.send_signal(signal.SIGKILL)
+            process.wait()
+            assert wait_for(lambda: live_leases() == WORKERS - 1, LEASE_SECONDS + 10), "dead worker's lease never expired"
+            # Give the survivors a heartbeat and one check interval to pick up its providers
+            time.sleep(CHECK_INTERVAL_SECONDS + 2)
+            counts = measure_window()
+            total, shares = check_window(counts, workers)
+            print(f"   {total} checks in {WINDOW_SECONDS}s after failover, providers per worker {shares}")
+
+        steps = [
+            ("test_every_worker_holds_a_lease", all_leases),
+            ("test_providers_checked_once_across_workers", shared_checks),
+            ("test_survivors_take_over_dead_worker", failover),
+        ]
+        for name, step in steps:
+            try:
+                step()
+                print(f"✅ {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {name}: {e}")
+                break
+    finally:
+        for process, _ in workers:
+            process.terminate()
+        for process, _ in workers:
+            process.wait()
+        rpc_server.shutdown()
+        print(f"\nWorker logs: {workdir}")
+
+    return failed
+
+
+if __name__ == "__main__":
+    print("=== RPC Sentinel Worker Coordination Check ===\n")
+    exit(1 if main() else 0)
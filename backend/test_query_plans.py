@@ -0,0 +1,168 @@
+"""
+Query-plan regression checks for the hot health check and alert queries.
+
+Builds the schema in an in-memory SQLite database, runs the migrations and
+asserts with EXPLAIN QUERY PLAN that each query is answered by an index
+search instead of a full table scan. Run directly or through pytest.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import and_, create_engine, desc, or_, select
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from migrations import run_migrations
+from models import Provider, ProviderStatus, HealthCheck, HealthCheckRollup, Alert
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+Base.metadata.create_all(bind=engine)
+run_migrations(engine)
+
+
+def query_plan(statement) -> list:
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+    compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").all()
+    return [row[-1] for row in rows]
+
+
+def assert_index_search(statement, table: str, index: str):
+    plan = query_plan(statement)
+    table_steps = [step for step in plan if f" {table} " in f" {step} "]
+    assert table_steps, f"{table} missing from plan: {plan}"
+    for step in table_steps:
+        assert step.startswith("SEARCH"), f"full scan of {table}: {plan}"
+        assert index in step, f"{table} not using {index}: {plan}"
+    return plan
+
+
+def test_latest_check_for_provider():
+    """Latest health check per provider (providers list, realtime metrics)"""
+    statement = select(HealthCheck).where(
+        HealthCheck.provider_id == 1
+    ).order_by(desc(HealthCheck.checked_at)).limit(1)
+    plan = assert_index_search(statement, "health_checks", "ix_health_checks_provider_checked_at")
+    assert not any("TEMP B-TREE" in step for step in plan), f"sort not served by index: {plan}"
+
+
+def test_checks_in_range_for_provider():
+    """Health checks for one provider in a time window"""
+    statement = select(HealthCheck.id).where(
+        HealthCheck.provider_id == 1,
+        HealthCheck.checked_at >= datetime(2024, 1, 1),
+        HealthCheck.checked_at < datetime(2024, 1, 2)
+    )
+    assert_index_search(statement, "health_checks", "ix_health_checks_provider_checked_at")
+
+
+def test_checks_before_cutoff():
+    """Retention deletes of aged-out checks"""
+    statement = select(HealthCheck.id).where(
+        HealthCheck.checked_at < datetime.utcnow() - timedelta(days=30)
+    ).limit(1000)
+    assert_index_search(statement, "health_checks", "ix_health_checks_checked_at")
+
+
+def test_rollup_buckets_in_window():
+    """Day rollups for a metrics window, and rollup retention"""
+    statement = select(HealthCheckRollup.id).where(
+        HealthCheckRollup.granularity == "day",
+        HealthCheckRollup.bucket_start >= datetime.utcnow() - timedelta(days=7)
+    )
+    assert_index_search(statement, "health_check_rollups", "ix_health_check_rollups_granularity_bucket")
+
+
+def test_open_alerts_for_providers():
+    """Open offline alerts looked up on every health check write"""
+    statement = select(Alert.provider_id).where(
+        Alert.provider_id.in_([1, 2, 3]),
+        Alert.resolved == False,
+        Alert.severity == "error"
+    ).distinct()
+    assert_index_search(statement, "alerts", "ix_alerts_open_provider_severity")
+
+
+def test_alert_page_for_provider():
+    """Keyset page of one provider's alerts"""
+    cursor = datetime(2024, 1, 1)
+    statement = select(Alert.id, Provider.name).join(
+        Provider, Provider.id == Alert.provider_id
+    ).where(
+        Provider.user_id == 1,
+        Alert.provider_id == 3,
+        or_(Alert.created_at < cursor, and_(Alert.created_at == cursor, Alert.id < 10))
+    ).order_by(desc(Alert.created_at), desc(Alert.id)).limit(51)
+    plan = assert_index_search(statement, "alerts", "ix_alerts_provider_created_at_id")
+    assert not any("TEMP B-TREE" in step for step in plan), f"sort not served by index: {plan}"
+
+
+def test_alert_page_for_user():
+    """Keyset page of all of a user's alerts, without a provider filter"""
+    cursor = datetime(2024, 1, 1)
+    statement = select(Alert.id, Provider.name).join(
+        Provider, Provider.id == Alert.provider_id
+    ).where(
+        Provider.user_id == 1,
+        or_(Alert.created_at < cursor, and_(Alert.created_at == cursor, Alert.id < 10))
+    ).order_by(desc(Alert.created_at), desc(Alert.id)).limit(51)
+    # Each of the user's providers is read through its own index range and
+    # the pages merged; walking ix_alerts_created_at_id would read every
+    # user's alerts to fill one page
+    plan = assert_index_search(statement, "alerts", "ix_alerts_provider_created_at_id")
+    assert plan[0].startswith("SEARCH providers"), f"alerts not driven by the user's providers: {plan}"
+
+
+def test_route_for_group():
+    """Providers behind one /rpc/{group} route, with their current status"""
+    statement = select(Provider.id, Provider.url, ProviderStatus.last_status).outerjoin(
+        ProviderStatus, ProviderStatus.provider_id == Provider.id
+    ).where(
+        Provider.user_id == 1,
+        Provider.group_name == "eth"
+    )
+    assert_index_search(statement, "providers", "ix_providers_user_group")
+
+
+def test_export_checks_in_order():
+    """Health check export for one provider, streamed in time order"""
+    statement = select(HealthCheck.id, HealthCheck.checked_at).where(
+        HealthCheck.provider_id == 1,
+        HealthCheck.checked_at >= datetime(2024, 1, 1),
+        HealthCheck.checked_at < datetime(2024, 2, 1)
+    ).order_by(HealthCheck.checked_at, HealthCheck.id)
+    plan = assert_index_search(statement, "health_checks", "ix_health_checks_provider_checked_at")
+    assert not any("TEMP B-TREE" in step for step in plan), f"sort not served by index: {plan}"
+
+
+def test_relay_recent_statuses():
+    """Providers checked within the event relay's lookback window"""
+    statement = select(ProviderStatus.provider_id).where(
+        ProviderStatus.last_checked_at >= datetime(2024, 1, 1)
+    )
+    assert_index_search(statement, "provider_status", "ix_provider_status_last_checked_at")
+
+
+def test_relay_recently_resolved_alerts():
+    """Alerts resolved within the event relay's lookback window"""
+    statement = select(Alert.id).where(Alert.resolved_at >= datetime(2024, 1, 1))
+    assert_index_search(statement, "alerts", "ix_alerts_resolved_at")
+
+
+if __name__ == "__main__":
+    print("=== RPC Sentinel Query Plan Checks ===\n")
+
+    failed = 0
+    for name, check in list(globals().items()):
+        if name.startswith("test_") and callable(check):
+            try:
+                check()
+                print(f"✅ {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {name}: {e}")
+
+    exit(1 if failed else 0)
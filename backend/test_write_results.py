@@ -0,0 +1,98 @@
+"""
+Alert history checks for batched health check writes.
+
+Builds the schema in an in-memory SQLite database and writes batches that
+hold several results for one provider, as happens when a failed flush is
+retried together with the next sweep. Run directly or through pytest.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from migrations import run_migrations
+from models import User, Provider, ProviderStatus, Alert
+from services.write_buffer import write_results
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+Base.metadata.create_all(bind=engine)
+run_migrations(engine)
+Session = sessionmaker(bind=engine)
+
+START = datetime(2024, 1, 1)
+
+
+def new_provider(db) -> Provider:
+    user = User(email=f"user{datetime.utcnow().timestamp()}@example.com", hashed_password="-")
+    db.add(user)
+    db.flush()
+    provider = Provider(user_id=user.id, name="Provider", url="http://127.0.0.1:1")
+    db.add(provider)
+    db.commit()
+    return provider
+
+
+def entry(provider: Provider, status: str, minutes: int) -> dict:
+    return {
+        "provider_id": provider.id,
+        "provider_name": provider.name,
+        "status": status,
+        "response_time_ms": 10.0 if status == "online" else None,
+        "error_message": None if status == "online" else "down",
+        "checked_at": START + timedelta(minutes=minutes)
+    }
+
+
+def alerts(db, provider: Provider) -> list:
+    return db.execute(
+        select(Alert.resolved, Alert.resolved_at).where(Alert.provider_id == provider.id).order_by(Alert.id)
+    ).all()
+
+
+def test_recovery_then_outage_in_one_batch():
+    """An alert opened before the batch is resolved; the new outage stays open"""
+    with Session() as db:
+        provider = new_provider(db)
+        write_results(db, [entry(provider, "offline", 0)])
+        events = []
+        write_results(db, [entry(provider, "online", 5), entry(provider, "offline", 10)], events=events)
+
+        assert alerts(db, provider) == [(True, START + timedelta(minutes=5)), (False, None)], alerts(db, provider)
+        assert db.get(ProviderStatus, provider.id).last_status == "offline"
+        kinds = [event for _, event, _ in events]
+        assert kinds.count("alert_resolved") == 1 and kinds.count("alert_opened") == 1, kinds
+
+
+def test_flap_inside_one_batch():
+    """offline, online, offline in one batch leaves exactly the last alert open"""
+    with Session() as db:
+        provider = new_provider(db)
+        write_results(db, [
+            entry(provider, "offline", 0),
+            entry(provider, "online", 5),
+            entry(provider, "offline", 10)
+        ])
+
+        assert alerts(db, provider) == [(True, START + timedelta(minutes=5)), (False, None)], alerts(db, provider)
+        assert db.get(ProviderStatus, provider.id).last_status == "offline"
+
+
+if __name__ == "__main__":
+    print("=== RPC Sentinel Write Batch Checks ===\n")
+
+    failed = 0
+    for name, check in list(globals().items()):
+        if name.startswith("test_") and callable(check):
+            try:
+                check()
+                print(f"✅ {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {name}: {e}")
+
+    exit(1 if failed else 0)
@@ -1,5 +1,6 @@
 import { useState, useEffect } from "react";
 import { api } from "@/lib/api";
+import { subscribeEvents } from "@/lib/events";
 
 interface Alert {
   id: number;
@@ -30,6 +31,17 @@ export const useProviderAlerts = () => {
     };
 
     fetchAlerts();
+
+    // New and resolved alerts are pushed by the backend
+    return subscribeEvents((event, data) => {
+      if (event === "alert_opened") {
+        setAlerts((current) => [data, ...current.filter((alert) => alert.id !== data.id)]);
+      } else if (event === "alert_resolved") {
+        setAlerts((current) =>
+          current.map((alert) => (alert.id === data.id ? { ...alert, resolved: true } : alert))
+        );
+      }
+    });
   }, []);
 
   return { alerts, loading };
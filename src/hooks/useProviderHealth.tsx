@@ -1,6 +1,7 @@
 import { useState, useCallback, useEffect } from "react";
 import { toast } from "sonner";
 import { api } from "@/lib/api";
+import { subscribeEvents } from "@/lib/events";
 
 interface HealthCheck {
   status: string;
@@ -69,6 +70,37 @@ export const useProviderHealth = () => {
     fetchProviders();
   }, [fetchProviders]);
 
+  // Status changes are pushed by the backend instead of polled
+  useEffect(() => {
+    const applyStatus = (update: any) => {
+      setProviders((current) => {
+        const existing = current.get(update.provider_name);
+        if (!existing) {
+          return current;
+        }
+        const next = new Map(current);
+        next.set(update.provider_name, {
+          ...existing,
+          status: update.status,
+          response_time_ms: update.response_time_ms || 0,
+          uptime: update.uptime,
+          last_checked: update.last_checked
+        });
+        return next;
+      });
+    };
+
+    return subscribeEvents((event, data) => {
+      if (event === "provider_status") {
+        applyStatus(data);
+      } else if (event === "snapshot") {
+        data.providers.forEach(applyStatus);
+      } else if (event.startsWith("provider_")) {
+        fetchProviders();
+      }
+    });
+  }, [fetchProviders]);
+
   return {
     providers,
     loading,
@@ -15,6 +15,10 @@ class ApiClient {
         console.log('ApiClient initialized with baseUrl:', this.baseUrl);
     }
 
+    url(endpoint: string): string {
+        return `${this.baseUrl}${endpoint}`;
+    }
+
     private getAuthHeader(): HeadersInit {
         const token = localStorage.getItem('auth_token');
         if (token) {
@@ -0,0 +1,58 @@
+import { api } from '@/lib/api';
+
+type Listener = (event: string, data: any) => void;
+
+const EVENT_TYPES = [
+    'snapshot',
+    'provider_status',
+    'alert_opened',
+    'alert_resolved',
+    'provider_created',
+    'provider_updated',
+    'provider_deleted',
+];
+
+const listeners = new Set<Listener>();
+let source: EventSource | null = null;
+
+function open() {
+    const token = localStorage.getItem('auth_token');
+    if (!token) {
+        return;
+    }
+
+    source = new EventSource(api.url(`/api/events/stream?token=${encodeURIComponent(token)}`));
+    EVENT_TYPES.forEach((type) => {
+        source!.addEventListener(type, (message) => {
+            const data = JSON.parse((message as MessageEvent).data);
+            listeners.forEach((listener) => listener(type, data));
+        });
+    });
+    // The server ends the stream after "resync"; reconnecting starts from a new snapshot
+    source.addEventListener('resync', () => {
+        source?.close();
+        source = null;
+        if (listeners.size) {
+            open();
+        }
+    });
+}
+
+/**
+ * Listen to the shared provider event stream. One EventSource is kept open
+ * while at least one listener is subscribed. Returns an unsubscribe function.
+ */
+export function subscribeEvents(listener: Listener): () => void {
+    listeners.add(listener);
+    if (!source) {
+        open();
+    }
+
+    return () => {
+        listeners.delete(listener);
+        if (!listeners.size && source) {
+            source.close();
+            source = null;
+        }
+    };
+}
@@ -26,20 +26,6 @@ const Dashboard = () => {
     }
   }, [user, authLoading, navigate]);
 
-  // Trigger initial health check and set up interval
-  useEffect(() => {
-    if (user) {
-      triggerHealthCheck();
-      
-      // Run health check every 30 seconds
-      const interval = setInterval(() => {
-        triggerHealthCheck();
-      }, 30000);
-
-      return () => clearInterval(interval);
-    }
-  }, [user]);
-
   // Convert Map to Array for rendering
   const providerArray = Array.from(providers.values()).map(p => ({
     name: p.provider_url.includes('primordial') 